@@ -0,0 +1,183 @@
+"""相談内容のリスクレベル・ニーズ判定"""
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from keyword_matcher import KeywordMatcher
+
+if TYPE_CHECKING:
+    from semantic import SemanticScorer
+
+# リスクレベル判定用キーワード辞書
+RISK_KEYWORDS = {
+    5: {  # 最高リスク - 即座の専門家介入が必要
+        'keywords': ['死にたい', '自殺', '消えたい', '生きる意味', '死のう',
+                    '飛び降り', '首を', 'リストカット', '薬を大量に'],
+        'weight': 10
+    },
+    4: {  # 高リスク - 専門家への連携推奨
+        'keywords': ['誰も信じられない', '絶望', '助けて', '限界', '耐えられない',
+                    '居場所がない', '孤独', '消えたい', '不登校', '行けない'],
+        'weight': 7
+    },
+    3: {  # 中リスク - AI対話継続・注意深い傾聴
+        'keywords': ['辛い', 'しんどい', '苦しい', 'ストレス', '眠れない',
+                    '食欲がない', '疲れた', '不安', '心配', 'プレッシャー'],
+        'weight': 4
+    },
+    2: {  # 低リスク - AI対話継続
+        'keywords': ['悩み', '困っている', 'どうしよう', '迷っている',
+                    '友達', '勉強', '進路', '部活', '先生'],
+        'weight': 2
+    },
+    1: {  # 最低リスク - 通常対話
+        'keywords': ['相談', '聞いて', '話したい', 'アドバイス'],
+        'weight': 1
+    }
+}
+
+# ニーズ判定用キーワード
+NEEDS_KEYWORDS = {
+    'listening': ['聞いてほしい', '話を聞いて', '誰かに話したい', '吐き出したい',
+                 'わかってほしい', '共感', '理解してほしい'],
+    'solution': ['どうすれば', '解決', '方法', 'アドバイス', '改善',
+                '対策', 'やり方', '教えて'],
+    'thinking': ['どう思う', '考えたい', '一緒に', '選択', '決断',
+                '進路', 'どちらが', '迷っている']
+}
+
+
+class TextAnalysis(NamedTuple):
+    """1回の走査で得られる判定結果"""
+    risk_level: int
+    detected_keywords: List[str]
+    risk_scores: Dict[int, int]
+    needs_type: str
+    needs_scores: Dict[str, int]
+    matches: List[Tuple[int, str]]  # (開始位置, キーワード)
+    keyword_level: int   # キーワード一致のみによるリスクレベル
+    semantic_level: int  # 言い回しの類似度によるリスクレベル（該当なしは0）
+
+
+def _build_matcher(risk_keywords: Dict, needs_keywords: Dict) -> Tuple[KeywordMatcher, List[List[Tuple]]]:
+    """両辞書のキーワードから照合器と、キーワードIDごとの加点先を構築
+
+    加点先は (辞書内の通し番号, 'risk' | 'needs', レベル or ニーズ種別) のタプル。
+    同じキーワードが複数の区分に含まれていても、それぞれに加点される。
+    """
+    entries = []
+    for level, data in risk_keywords.items():
+        for keyword in data['keywords']:
+            entries.append((keyword, 'risk', level))
+    for need_type, keywords in needs_keywords.items():
+        for keyword in keywords:
+            entries.append((keyword, 'needs', need_type))
+
+    matcher = KeywordMatcher(keyword for keyword, _, _ in entries)
+    keyword_ids = {keyword: i for i, keyword in enumerate(matcher.keywords)}
+    targets: List[List[Tuple]] = [[] for _ in matcher.keywords]
+    for order, (keyword, kind, key) in enumerate(entries):
+        targets[keyword_ids[keyword]].append((order, kind, key))
+    return matcher, targets
+
+
+# 照合器はインポート時に一度だけ構築する
+_MATCHER, _TARGETS = _build_matcher(RISK_KEYWORDS, NEEDS_KEYWORDS)
+
+# キーワードに一致しない言い回し（ひらがな表記・言い換え）も拾う2段目の判定。
+# False にするとキーワード一致のみで判定する
+USE_SEMANTIC_SCORER = True
+# 2段目の判定だけで該当した場合（キーワードでレベル3以上の一致がない場合）に採用する上限。
+# 短い言い回しの部分一致だけでレベル5（119番の案内）にはしない
+SEMANTIC_ONLY_MAX_LEVEL = 4
+_semantic_scorer: Optional['SemanticScorer'] = None
+_semantic_lock = threading.Lock()
+
+
+def get_semantic_scorer() -> 'SemanticScorer':
+    """2段目の判定器（NumPy の読み込みと行列の構築は初回の判定時まで遅らせる）"""
+    global _semantic_scorer
+    if _semantic_scorer is None:
+        with _semantic_lock:
+            if _semantic_scorer is None:
+                from semantic import SemanticScorer
+                _semantic_scorer = SemanticScorer()
+    return _semantic_scorer
+
+
+def analyze_text(text: str) -> TextAnalysis:
+    """リスクレベルとニーズを1回の走査でまとめて判定"""
+    semantic_level = get_semantic_scorer().score(text) if USE_SEMANTIC_SCORER else 0
+    return _analyze(text, semantic_level)
+
+
+def _analyze(text: str, semantic_level: int) -> TextAnalysis:
+    keywords = _MATCHER.keywords
+    matches = []
+    matched_ids = set()
+    for start, keyword_id in _MATCHER.iter_matches(text.lower()):
+        matches.append((start, keywords[keyword_id]))
+        matched_ids.add(keyword_id)
+
+    # 従来の判定と同じく、各キーワードは出現回数にかかわらず1回だけ加点し、
+    # 検出キーワードは辞書の並び順で返す
+    hits = sorted((order, kind, key, keywords[keyword_id])
+                  for keyword_id in matched_ids
+                  for order, kind, key in _TARGETS[keyword_id])
+
+    detected_keywords = []
+    risk_scores = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+    needs_scores = {'listening': 0, 'solution': 0, 'thinking': 0}
+    for _, kind, key, keyword in hits:
+        if kind == 'risk':
+            risk_scores[key] += RISK_KEYWORDS[key]['weight']
+            detected_keywords.append(keyword)
+        else:
+            needs_scores[key] += 1
+
+    max_level = 1
+    max_score = 0
+    for level, score in risk_scores.items():
+        if score > max_score:
+            max_score = score
+            max_level = level
+
+    if max(needs_scores.values()) == 0:
+        needs_type = 'listening'
+    else:
+        needs_type = max(needs_scores, key=needs_scores.get)
+
+    risk_level = combine_levels(max_level, semantic_level)
+
+    return TextAnalysis(risk_level, detected_keywords, risk_scores, needs_type, needs_scores, matches,
+                        max_level, semantic_level)
+
+
+def combine_levels(keyword_level: int, semantic_level: int) -> int:
+    """キーワードと言い回しの判定を合わせたリスクレベル
+
+    安全側に倒して高い方を採用するが、言い回しだけの該当は SEMANTIC_ONLY_MAX_LEVEL までにとどめる。
+    """
+    if keyword_level < 3:
+        semantic_level = min(semantic_level, SEMANTIC_ONLY_MAX_LEVEL)
+    return max(keyword_level, semantic_level)
+
+
+def analyze_texts(texts: Iterable[str]) -> List[TextAnalysis]:
+    """複数の相談内容をまとめて判定（オフラインの再採点向け）"""
+    texts = list(texts)
+    if USE_SEMANTIC_SCORER:
+        semantic_levels = get_semantic_scorer().score_batch(texts)
+    else:
+        semantic_levels = [0] * len(texts)
+    return [_analyze(text, int(level)) for text, level in zip(texts, semantic_levels)]
+
+
+def analyze_risk_level(text: str) -> Tuple[int, List[str]]:
+    """相談内容からリスクレベルを判定"""
+    result = analyze_text(text)
+    return result.risk_level, result.detected_keywords
+
+
+def analyze_needs(text: str) -> str:
+    """相談者のニーズを分析（キーワードの照合のみで、2段目の判定は行わない）"""
+    return _analyze(text, 0).needs_type
@@ -0,0 +1,163 @@
+"""フィードバック（評価）と応答のメタデータ（リスクレベル・ニーズ・モデル・応答時間）の集計"""
+import sqlite3
+import threading
+from typing import Dict, List
+
+import pandas as pd
+
+FEEDBACK_COLUMNS = ['rowid', 'session_id', 'message_id', 'rating', 'timestamp', 'risk_level', 'needs_type', 'model',
+                    'time_to_first_token', 'response_time']
+KEYWORD_COLUMNS = ['rowid', 'keyword', 'rating']
+RESPONSE_COLUMNS = ['rowid', 'timestamp', 'model', 'risk_level', 'time_to_first_token', 'response_time']
+
+LATENCY_QUANTILES = [0.5, 0.9, 0.99]
+
+# メタデータは SQLite の JSON 関数で取り出し、Python側で1行ずつ解析しない
+_FEEDBACK_SQL = """
+    SELECT f.rowid, f.session_id, f.message_id, f.rating, f.timestamp,
+           json_extract(m.meta, '$.risk_level'), json_extract(m.meta, '$.needs_type'), json_extract(m.meta, '$.model'),
+           json_extract(m.meta, '$.time_to_first_token'), json_extract(m.meta, '$.response_time')
+    FROM feedback f LEFT JOIN messages m ON m.session_id = f.session_id AND m.seq = f.message_id
+    WHERE f.rowid > ? ORDER BY f.rowid
+"""
+_KEYWORD_SQL = """
+    SELECT f.rowid, k.value, f.rating
+    FROM feedback f JOIN messages m ON m.session_id = f.session_id AND m.seq = f.message_id,
+         json_each(m.meta, '$.detected_keywords') k
+    WHERE f.rowid > ? ORDER BY f.rowid
+"""
+_RESPONSE_SQL = """
+    SELECT rowid, timestamp, json_extract(meta, '$.model'), json_extract(meta, '$.risk_level'),
+           json_extract(meta, '$.time_to_first_token'), json_extract(meta, '$.response_time')
+    FROM messages WHERE role = 'assistant' AND rowid > ? ORDER BY rowid
+"""
+
+
+def _frame(rows: List, columns: List[str]) -> pd.DataFrame:
+    frame = pd.DataFrame.from_records(rows, columns=columns)
+    for column in ('rating', 'risk_level', 'time_to_first_token', 'response_time'):
+        if column in frame:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce')
+    for column in ('timestamp', 'model', 'needs_type', 'keyword', 'session_id'):
+        if column in frame:
+            frame[column] = frame[column].astype('string')
+    return frame
+
+
+def since(frames: Dict[str, pd.DataFrame], start: str) -> Dict[str, pd.DataFrame]:
+    """timestamp（ISO形式の文字列）が start 以降の行に絞り込む（キーワードは評価の行に合わせる）"""
+    feedback = frames['feedback'][frames['feedback']['timestamp'] >= start]
+    return {
+        'feedback': feedback,
+        'keywords': frames['keywords'][frames['keywords']['rowid'].isin(feedback['rowid'])],
+        'responses': frames['responses'][frames['responses']['timestamp'] >= start],
+    }
+
+
+class FeedbackDataset:
+    """保存先（SQLite）から読み込んだ集計用のデータ
+
+    refresh() は前回以降に追加された行（rowid がより大きい行）だけを読み込んで追加する。
+    version は読み込み済みの行が変わるたびに変わり、集計結果のキャッシュのキーに使う。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.feedback = _frame([], FEEDBACK_COLUMNS)
+        self.keywords = _frame([], KEYWORD_COLUMNS)
+        self.responses = _frame([], RESPONSE_COLUMNS)
+        self._lock = threading.Lock()
+
+    def frames(self) -> Dict[str, pd.DataFrame]:
+        return {'feedback': self.feedback, 'keywords': self.keywords, 'responses': self.responses}
+
+    @property
+    def version(self) -> tuple:
+        return (self._last_rowid(self.feedback), self._last_rowid(self.responses))
+
+    @staticmethod
+    def _last_rowid(frame: pd.DataFrame) -> int:
+        return int(frame['rowid'].iloc[-1]) if len(frame) else 0
+
+    def refresh(self) -> tuple:
+        """新しい行を読み込み、version を返す"""
+        with self._lock:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                last_feedback = self._last_rowid(self.feedback)
+                self.feedback = self._append(self.feedback, conn, _FEEDBACK_SQL, last_feedback, FEEDBACK_COLUMNS)
+                self.keywords = self._append(self.keywords, conn, _KEYWORD_SQL, last_feedback, KEYWORD_COLUMNS)
+                self.responses = self._append(self.responses, conn, _RESPONSE_SQL, self._last_rowid(self.responses),
+                                              RESPONSE_COLUMNS)
+            except sqlite3.OperationalError:
+                # まだテーブルが作られていない（一度も保存されていない）
+                pass
+            finally:
+                conn.close()
+            return self.version
+
+    @staticmethod
+    def _append(frame: pd.DataFrame, conn: sqlite3.Connection, sql: str, after: int, columns: List[str]) -> pd.DataFrame:
+        rows = conn.execute(sql, (after,)).fetchall()
+        if not rows:
+            return frame
+        new = _frame(rows, columns)
+        return new if frame.empty else pd.concat([frame, new], ignore_index=True)
+
+
+def session_frames(chat_history: List[Dict], feedback_data: List[Dict]) -> Dict[str, pd.DataFrame]:
+    """保存しない設定の場合に、現在のセッションの会話履歴とフィードバックから同じ形のデータを作る"""
+    feedback_rows, keyword_rows, response_rows = [], [], []
+    for i, fb in enumerate(feedback_data):
+        message_id = fb['message_id']
+        message = chat_history[message_id] if 0 <= message_id < len(chat_history) else {}
+        feedback_rows.append((i + 1, None, message_id, fb['rating'], fb.get('timestamp'), message.get('risk_level'),
+                              message.get('needs_type'), message.get('model'), message.get('time_to_first_token'),
+                              message.get('response_time')))
+        keyword_rows.extend((i + 1, keyword, fb['rating']) for keyword in message.get('detected_keywords') or ())
+    for i, message in enumerate(chat_history):
+        if message['role'] == 'assistant':
+            response_rows.append((i + 1, message.get('timestamp'), message.get('model'), message.get('risk_level'),
+                                  message.get('time_to_first_token'), message.get('response_time')))
+    return {
+        'feedback': _frame(feedback_rows, FEEDBACK_COLUMNS),
+        'keywords': _frame(keyword_rows, KEYWORD_COLUMNS),
+        'responses': _frame(response_rows, RESPONSE_COLUMNS),
+    }
+
+
+def _rating_by(frame: pd.DataFrame, column: str) -> pd.DataFrame:
+    """区分ごとの件数・平均評価・低評価（2以下）の割合"""
+    return (
+        frame.assign(low=frame['rating'] <= 2)
+        .groupby(column)
+        .agg(件数=('rating', 'size'), 平均評価=('rating', 'mean'), 低評価の割合=('low', 'mean'))
+        .round(3)
+    )
+
+
+def summarize(feedback: pd.DataFrame, keywords: pd.DataFrame, responses: pd.DataFrame,
+              top_keywords: int = 20) -> Dict[str, pd.DataFrame]:
+    """評価の区分別の集計と、モデルごとの応答時間の分位点"""
+    low = (feedback['rating'] <= 2)
+    by_keyword = _rating_by(keywords, 'keyword').sort_values('件数', ascending=False).head(top_keywords)
+    latency = (
+        responses.groupby('model')[['time_to_first_token', 'response_time']]
+        .quantile(LATENCY_QUANTILES)
+        .unstack()
+        .round(3)
+    )
+    if not latency.empty:
+        latency.columns = [f"{'応答開始' if name == 'time_to_first_token' else '全体'} p{int(q * 100)}"
+                           for name, q in latency.columns]
+    daily = _rating_by(feedback.assign(date=feedback['timestamp'].str.slice(0, 10)), 'date')
+    return {
+        'overall': pd.DataFrame({'件数': [len(feedback)], '平均評価': [round(feedback['rating'].mean(), 3)],
+                                 '低評価の割合': [round(low.mean(), 3)], '応答数': [len(responses)]}),
+        'by_risk_level': _rating_by(feedback, 'risk_level'),
+        'by_needs_type': _rating_by(feedback, 'needs_type'),
+        'by_model': _rating_by(feedback, 'model'),
+        'by_keyword': by_keyword,
+        'latency': latency,
+        'daily': daily,
+    }
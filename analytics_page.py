@@ -0,0 +1,119 @@
+import streamlit as st
+import datetime
+import hmac
+import os
+from typing import Dict, Optional
+
+import pandas as pd
+
+from analytics import FeedbackDataset, session_frames, since, summarize
+from storage import DEFAULT_BACKEND, DEFAULT_DB_PATH
+
+# ページ設定
+st.set_page_config(
+    page_title="フィードバック分析",
+    page_icon="📈",
+    layout="wide"
+)
+
+PERIODS = {
+    '全期間': None,
+    '直近30日': 30,
+    '直近7日': 7,
+}
+
+
+def operator_password() -> Optional[str]:
+    """運営者用パスワード（環境変数 CHAT_ANALYTICS_PASSWORD、なければ secrets の analytics_password）"""
+    password = os.environ.get('CHAT_ANALYTICS_PASSWORD')
+    if password:
+        return password
+    try:
+        return st.secrets.get('analytics_password') or None
+    except FileNotFoundError:
+        # secrets.toml が無い場合
+        return None
+
+
+@st.cache_resource
+def get_dataset(db_path: str) -> FeedbackDataset:
+    """全セッションで共有する集計用データ（新しい行だけを追加で読み込む）"""
+    return FeedbackDataset(db_path)
+
+
+@st.cache_data(max_entries=16)
+def cached_summary(_frames: Dict[str, pd.DataFrame], version: tuple, period: str) -> Dict[str, pd.DataFrame]:
+    """集計結果（データの version と期間が同じ間は再計算しない。_frames はキャッシュのキーに含めない）"""
+    days = PERIODS[period]
+    if days is not None:
+        start = (datetime.datetime.now() - datetime.timedelta(days=days)).date().isoformat()
+        _frames = since(_frames, start)
+    return summarize(**_frames)
+
+
+st.title("📈 フィードバック分析")
+
+# 集計には全セッションの評価・検出キーワードが含まれるため、運営者用パスワードを確認する
+password = operator_password()
+if password is None:
+    st.error("運営者用のパスワードが設定されていないため表示できません"
+             "（CHAT_ANALYTICS_PASSWORD または secrets の analytics_password を設定してください）。")
+    st.stop()
+if not st.session_state.get('analytics_authenticated'):
+    with st.form("analytics_login"):
+        entered = st.text_input("運営者用パスワード", type="password")
+        submitted = st.form_submit_button("表示")
+    if submitted and hmac.compare_digest(entered.encode('utf-8'), password.encode('utf-8')):
+        st.session_state.analytics_authenticated = True
+        st.rerun()
+    if submitted:
+        st.error("パスワードが違います")
+    st.stop()
+
+col1, col2 = st.columns([3, 1])
+with col2:
+    period = st.selectbox("期間", list(PERIODS))
+
+if DEFAULT_BACKEND == 'sqlite' and os.path.exists(DEFAULT_DB_PATH):
+    dataset = get_dataset(DEFAULT_DB_PATH)
+    version = dataset.refresh()
+    frames = dataset.frames()
+    with col1:
+        st.caption(f"保存済みの全セッション（{DEFAULT_DB_PATH}）の評価を集計しています")
+else:
+    chat_history = st.session_state.get('chat_history', [])
+    feedback_data = st.session_state.get('feedback_data', [])
+    frames = session_frames(chat_history, feedback_data)
+    version = ('session', st.session_state.get('session_id'), len(chat_history), len(feedback_data))
+    with col1:
+        st.caption("会話履歴を保存しない設定のため、このセッションの評価のみを集計しています")
+
+summary = cached_summary(frames, version, period)
+
+if summary['overall']['件数'].iloc[0] == 0:
+    st.info("まだ評価がありません。")
+
+st.dataframe(summary['overall'], hide_index=True, use_container_width=True)
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.subheader("リスクレベル別")
+    st.dataframe(summary['by_risk_level'], use_container_width=True)
+with col2:
+    st.subheader("ニーズ別")
+    st.dataframe(summary['by_needs_type'], use_container_width=True)
+with col3:
+    st.subheader("モデル別")
+    st.dataframe(summary['by_model'], use_container_width=True)
+
+col1, col2 = st.columns(2)
+with col1:
+    st.subheader("検出キーワード別（上位20件）")
+    st.dataframe(summary['by_keyword'], use_container_width=True)
+with col2:
+    st.subheader("応答時間（秒）")
+    st.dataframe(summary['latency'], use_container_width=True)
+
+st.subheader("日別の平均評価")
+if not summary['daily'].empty:
+    st.line_chart(summary['daily']['平均評価'])
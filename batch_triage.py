@@ -0,0 +1,253 @@
+"""保存済みの相談内容をまとめて再判定するコマンドラインツール
+
+    python batch_triage.py archive.jsonl --out results/rescore
+    python batch_triage.py archive.csv --out results/rescore --resume
+
+入力（JSONL または CSV）を一定件数ずつ読み込み、CHUNK_SIZE 件ごとにプロセスプールで
+analyze_texts（リスクレベル・ニーズ判定をまとめて行う）にかけ、結果を逐次書き出す。
+  <out>.messages.jsonl       メッセージごとの判定結果
+  <out>.conversations.jsonl  会話ごとの集計（最高リスクレベル、蓄積を踏まえたレベルの推移、キーワード出現数など）
+  <out>.checkpoint.json      中断時に --resume で再開するための進捗
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from analysis import analyze_texts
+from risk_tracker import RiskTracker
+
+# 一度にプールへ渡す件数（メモリ使用量はこの件数分で頭打ちになる）
+WINDOW_SIZE = 20000
+# ワーカーが1回の analyze_texts でまとめて判定する件数
+CHUNK_SIZE = 500
+
+
+def read_records(path: str, fmt: Optional[str] = None) -> Iterator[Dict]:
+    """JSONL / CSV を1件ずつ読む"""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    with open(path, encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def score(texts: List[str]) -> List[Tuple[int, List[str], str, Dict[int, int]]]:
+    """ワーカープロセスで実行する判定（まとめて判定し、プロセス間で受け渡す値は最小限にする）"""
+    return [(result.risk_level, result.detected_keywords, result.needs_type, result.risk_scores)
+            for result in analyze_texts(texts)]
+
+
+def chunked(items: List, size: int) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _json_line(data: Dict) -> bytes:
+    return (json.dumps(data, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+class ConversationStats:
+    """会話ごとの集計"""
+
+    def __init__(self, conversation_id: str, data: Optional[Dict] = None):
+        data = data or {}
+        self.conversation_id = conversation_id
+        self.messages = data.get('messages', 0)
+        self.max_risk_level = data.get('max_risk_level', 0)
+        self.risk_levels: Dict[str, int] = data.get('risk_levels', {})
+        self.needs: Dict[str, int] = data.get('needs', {})
+        self.keywords: Dict[str, int] = data.get('keywords', {})
+        self.tracker = RiskTracker.from_dict(data['tracker']) if 'tracker' in data else RiskTracker()
+
+    def add(self, risk_level: int, keywords: List[str], needs_type: str, risk_scores: Dict[int, int],
+            timestamp=None) -> None:
+        self.messages += 1
+        self.tracker.update(risk_level, risk_scores, keywords, timestamp)
+        self.max_risk_level = max(self.max_risk_level, risk_level)
+        self.risk_levels[str(risk_level)] = self.risk_levels.get(str(risk_level), 0) + 1
+        self.needs[needs_type] = self.needs.get(needs_type, 0) + 1
+        for keyword in keywords:
+            self.keywords[keyword] = self.keywords.get(keyword, 0) + 1
+
+    def to_dict(self) -> Dict:
+        return {
+            'conversation_id': self.conversation_id,
+            'messages': self.messages,
+            'max_risk_level': self.max_risk_level,
+            'risk_levels': self.risk_levels,
+            'needs': self.needs,
+            'keywords': self.keywords,
+            'cumulative_level': self.tracker.level,
+            'cumulative_peak_level': self.tracker.peak_level,
+            'trend': self.tracker.trend,
+            'tracker': self.tracker.to_dict(),
+        }
+
+
+class Checkpoint:
+    """処理済み件数・出力ファイルの位置・集計途中の会話を保存し、再開時に復元する"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[Dict]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, state: Dict) -> None:
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def run(input_path: str, out_prefix: str, text_field: str = 'content', conversation_field: str = 'session_id',
+        role_field: str = 'role', timestamp_field: str = 'timestamp', fmt: Optional[str] = None, processes: Optional[int] = None,
+        grouped: bool = True, resume: bool = False, checkpoint_every: int = WINDOW_SIZE,
+        all_roles: bool = False, log=sys.stderr) -> Dict:
+    """入力を再判定して結果を書き出し、処理件数と速度を返す
+
+    grouped=True の場合、入力は会話ごとにまとまっているものとして扱い、
+    会話IDが変わった時点でその会話の集計を書き出す（保持する集計は常に1会話分）。
+    """
+    messages_path = out_prefix + '.messages.jsonl'
+    conversations_path = out_prefix + '.conversations.jsonl'
+    checkpoint = Checkpoint(out_prefix + '.checkpoint.json')
+
+    state = checkpoint.load() if resume else None
+    skip = 0
+    open_stats: Dict[str, ConversationStats] = {}
+    if state:
+        # 最後のチェックポイント以降の書きかけの出力を切り詰めて再開する
+        skip = state['records']
+        for path, offset in ((messages_path, state['messages_offset']), (conversations_path, state['conversations_offset'])):
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+        open_stats = {cid: ConversationStats(cid, data) for cid, data in state['open'].items()}
+        print(f"resuming after {skip} records", file=log)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(out_prefix)), exist_ok=True)
+        open(messages_path, 'w').close()
+        open(conversations_path, 'w').close()
+
+    records = read_records(input_path, fmt)
+    for _ in range(skip):
+        next(records, None)
+
+    processed = skip
+    scored = 0
+    started = time.perf_counter()
+    last_checkpoint = processed
+
+    # 再開時に書き込み位置（バイト単位）で切り詰められるようバイナリで開く
+    with open(messages_path, 'ab') as messages_out, \
+            open(conversations_path, 'ab') as conversations_out, \
+            multiprocessing.Pool(processes) as pool:
+
+        def flush_conversation(conversation_id: str) -> None:
+            stats = open_stats.pop(conversation_id)
+            conversations_out.write(_json_line(stats.to_dict()))
+
+        def save_checkpoint() -> None:
+            messages_out.flush()
+            conversations_out.flush()
+            checkpoint.save({
+                'records': processed,
+                'messages_offset': messages_out.tell(),
+                'conversations_offset': conversations_out.tell(),
+                'open': {cid: stats.to_dict() for cid, stats in open_stats.items()},
+            })
+
+        while True:
+            window = []
+            for record in records:
+                window.append(record)
+                if len(window) >= WINDOW_SIZE:
+                    break
+            if not window:
+                break
+
+            targets = [
+                i for i, record in enumerate(window)
+                if all_roles or record.get(role_field, 'user') == 'user'
+            ]
+            texts = [str(window[i].get(text_field) or '') for i in targets]
+            results = itertools.chain.from_iterable(pool.imap(score, chunked(texts, CHUNK_SIZE)))
+
+            for i, (risk_level, keywords, needs_type, risk_scores) in zip(targets, results):
+                record = window[i]
+                conversation_id = str(record.get(conversation_field, ''))
+                if grouped:
+                    for other in [cid for cid in open_stats if cid != conversation_id]:
+                        flush_conversation(other)
+                stats = open_stats.get(conversation_id)
+                if stats is None:
+                    stats = open_stats[conversation_id] = ConversationStats(conversation_id)
+                stats.add(risk_level, keywords, needs_type, risk_scores, record.get(timestamp_field))
+                messages_out.write(_json_line({
+                    'record': processed + i,
+                    'conversation_id': conversation_id,
+                    'id': record.get('id'),
+                    'risk_level': risk_level,
+                    'detected_keywords': keywords,
+                    'needs_type': needs_type,
+                    'risk_scores': risk_scores,
+                }))
+
+            processed += len(window)
+            scored += len(targets)
+            elapsed = time.perf_counter() - started
+            print(f"{processed} records ({scored / elapsed:.0f} messages/sec)", file=log)
+            if processed - last_checkpoint >= checkpoint_every:
+                save_checkpoint()
+                last_checkpoint = processed
+
+        for conversation_id in list(open_stats):
+            flush_conversation(conversation_id)
+        save_checkpoint()
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        'records': processed,
+        'scored': scored,
+        'seconds': round(elapsed, 3),
+        'messages_per_sec': round(scored / elapsed, 1) if elapsed > 0 else None,
+    }
+    print(json.dumps(summary), file=log)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="保存済みの相談内容をまとめて再判定する")
+    parser.add_argument('input', help="入力ファイル（.jsonl / .csv）")
+    parser.add_argument('--out', required=True, help="出力ファイル名の接頭辞")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help="入力形式（既定は拡張子から判定）")
+    parser.add_argument('--text-field', default='content')
+    parser.add_argument('--conversation-field', default='session_id')
+    parser.add_argument('--role-field', default='role')
+    parser.add_argument('--timestamp-field', default='timestamp', help="リスクの蓄積を時間で減衰させるための時刻の列")
+    parser.add_argument('--all-roles', action='store_true', help="相談者以外（AI）の発言も判定する")
+    parser.add_argument('--processes', type=int, help="ワーカープロセス数（既定はCPU数）")
+    parser.add_argument('--ungrouped', action='store_true', help="入力が会話ごとにまとまっていない場合に指定")
+    parser.add_argument('--resume', action='store_true', help="前回のチェックポイントから再開する")
+    parser.add_argument('--checkpoint-every', type=int, default=WINDOW_SIZE)
+    args = parser.parse_args(argv)
+
+    run(args.input, args.out, text_field=args.text_field, conversation_field=args.conversation_field,
+        role_field=args.role_field, timestamp_field=args.timestamp_field, fmt=args.format, processes=args.processes, grouped=not args.ungrouped,
+        resume=args.resume, checkpoint_every=args.checkpoint_every, all_roles=args.all_roles)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""1ターンごとに実行される処理（判定・プロンプト組み立て）のマイクロベンチマーク
+
+    python benchmarks/bench_hotpath.py                      # 計測してベースラインと比較
+    python benchmarks/bench_hotpath.py --update-baseline    # ベースラインを書き換える
+    python benchmarks/bench_hotpath.py --update-baseline --filter analyze_   # 一部の項目だけ書き換える
+
+短い一言から数千字の長文までの相談文の分布と、大きなキーワード辞書を使い、
+1回あたりのCPU時間（µs）と、tracemalloc による1回あたりのメモリ確保量（ピーク、KB）を測る。
+ネットワークは使わない。ベースライン（benchmarks/baseline_hotpath.json）より
+--tolerance 倍以上遅くなった項目があれば終了コード1で終了する（CIでの回帰検出用）。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import analysis  # noqa: E402
+from context import ContextBuilder  # noqa: E402
+from fake_gemini import configure, fake_model_factory  # noqa: E402
+from fallback import FallbackEngine  # noqa: E402
+from gemini_client import build_response_prompt, generate_ai_response_gemini, generate_conversation_summary  # noqa: E402
+from prompts import generate_system_prompt  # noqa: E402
+from summary import SummaryCache, build_summary_prompt  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_hotpath.json")
+SEED = 20240601
+
+SENTENCES = [
+    "最近テスト勉強で疲れていて、夜もなかなか眠れません。",
+    "友達とけんかしてしまって、どうやって謝ればいいかわからないです。",
+    "部活の先輩が厳しくて、毎日行くのがつらいです。",
+    "進路のことで親と意見が合わず、迷っています。",
+    "授業中にみんなの前で発表するのが怖くて、心臓がどきどきします。",
+    "家に帰っても居場所がない気がして、ずっとスマホを見ています。",
+    "誰かに話を聞いてほしいけど、何から話せばいいのかわからない。",
+    "先生に相談しようと思ったけど、迷惑じゃないかと心配です。",
+    "今日は少しだけ気分がいいです。",
+    "本当はもう限界かもしれないと思うことがあります。",
+]
+SHORT_LINES = ["うん", "そうかも", "ありがとう", "わからない", "つらい", "聞いてほしい", "どうしよう", "疲れた"]
+
+
+def make_message(rng: random.Random) -> str:
+    """短い返事（約6割）・数文の相談（約3割）・数千字の長文（約1割）"""
+    roll = rng.random()
+    if roll < 0.6:
+        return rng.choice(SHORT_LINES)
+    sentences = rng.randint(2, 8) if roll < 0.9 else rng.randint(60, 150)
+    return "".join(rng.choice(SENTENCES) for _ in range(sentences))
+
+
+def make_history(rng: random.Random, turns: int) -> List[Dict]:
+    history = []
+    for _ in range(turns):
+        history.append({'role': 'user', 'content': make_message(rng)})
+        history.append({'role': 'assistant', 'content': "".join(rng.choice(SENTENCES) for _ in range(3)),
+                        'detected_keywords': ['疲れた']})
+    return history
+
+
+def large_risk_keywords(rng: random.Random, per_level: int) -> Dict:
+    """既存の辞書に、文中の語句を組み合わせた架空のキーワードを追加した大きな辞書"""
+    text = "".join(SENTENCES)
+    keywords = {}
+    for level, data in analysis.RISK_KEYWORDS.items():
+        extra = set()
+        while len(extra) < per_level:
+            start = rng.randrange(len(text) - 6)
+            extra.add(text[start:start + rng.randint(3, 6)] + rng.choice("あいうえおかきくけこ"))
+        keywords[level] = {'keywords': list(data['keywords']) + sorted(extra), 'weight': data['weight']}
+    return keywords
+
+
+def measure(fn: Callable[[], object], min_time: float, repeat: int) -> Dict[str, float]:
+    """1回あたりのCPU時間（µs、repeat回の中央値）と tracemalloc のピーク確保量（KB）"""
+    fn()
+    loops = 1
+    while True:
+        started = time.process_time()
+        for _ in range(loops):
+            fn()
+        if time.process_time() - started >= min_time / 10 or loops >= 1 << 20:
+            break
+        loops *= 2
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        for _ in range(loops):
+            fn()
+        samples.append((time.process_time() - started) / loops * 1e6)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'us_per_op': round(statistics.median(samples), 3), 'alloc_kb': round((peak - baseline) / 1024, 2)}
+
+
+def build_cases(rng: random.Random) -> Dict[str, Callable[[], object]]:
+    messages = [make_message(rng) for _ in range(200)]
+    long_message = "".join(SENTENCES) * 30  # 約1万字
+    cases: Dict[str, Callable[[], object]] = {}
+
+    def over_messages(fn):
+        state = {'i': 0}
+
+        def run():
+            state['i'] = (state['i'] + 1) % len(messages)
+            return fn(messages[state['i']])
+        return run
+
+    cases['analyze_risk_level/mixed'] = over_messages(analysis.analyze_risk_level)
+    cases['analyze_risk_level/10k_chars'] = lambda: analysis.analyze_risk_level(long_message)
+    cases['analyze_needs/mixed'] = over_messages(analysis.analyze_needs)
+    cases['analyze_text/mixed'] = over_messages(analysis.analyze_text)
+
+    # 現在の辞書（約60件、str.find で照合）と、5千件の辞書（オートマトンで照合）
+    current = analysis._MATCHER
+    cases['keyword_matcher/current/mixed'] = over_messages(lambda text: list(current.iter_matches(text)))
+    cases['keyword_matcher/current/10k_chars'] = lambda: list(current.iter_matches(long_message))
+    matcher, _ = analysis._build_matcher(large_risk_keywords(rng, 1000), analysis.NEEDS_KEYWORDS)
+    cases['keyword_matcher/5k_keywords/mixed'] = over_messages(lambda text: list(matcher.iter_matches(text)))
+    cases['keyword_matcher/5k_keywords/10k_chars'] = lambda: list(matcher.iter_matches(long_message))
+
+    cases['generate_system_prompt'] = lambda: generate_system_prompt(4, 'listening')
+
+    # 会話が1ターン進むごとのプロンプト組み立て（ContextBuilder はセッション中使い回される）
+    for turns in (10, 100):
+        history = make_history(rng, turns)
+
+        def next_turn(history=history, state={}):
+            if 'context' not in state or len(state['history']) > len(history) + 200:
+                state['context'] = ContextBuilder()
+                state['history'] = list(history)
+            state['history'].append({'role': 'user', 'content': messages[len(state['history']) % len(messages)]})
+            state['history'].append({'role': 'assistant', 'content': SENTENCES[0]})
+            return build_response_prompt(state['history'][-2]['content'], 3, 'listening', state['history'][:-1],
+                                         state['context'], 'gemini-2.5-flash-lite')
+        cases[f'build_response_prompt/turn/{turns}_turns'] = next_turn
+        cases[f'build_response_prompt/cold/{turns}_turns'] = (
+            lambda history=history: build_response_prompt("つらい", 3, 'listening', history, ContextBuilder()))
+        cases[f'build_summary_prompt/{turns}_turns'] = lambda history=history: build_summary_prompt(history)
+
+    # 生成関数全体（応答時間0の代役モデルで、組み立てとフォールバック処理のみの負荷）
+    configure(latency=0.001, latency_sigma=0.0, chunk_interval=0.0, quota_error_rate=0.0, failure_rate=0.0,
+              stream_failure_rate=0.0, rpm=None)
+    factory = fake_model_factory("benchmark", seed=SEED)
+    engine = FallbackEngine(hedge=False)
+    history = make_history(rng, 10)
+    context = ContextBuilder()
+    cases['generate_ai_response_gemini/10_turns'] = lambda: generate_ai_response_gemini(
+        "最近眠れない", 3, 'listening', history, "benchmark", model_factory=factory, engine=engine, context=context)
+    cases['generate_conversation_summary/10_turns'] = lambda: generate_conversation_summary(
+        history, "benchmark", model_factory=factory, engine=engine, cache=SummaryCache())
+    return cases
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="ベースラインの何倍を回帰とみなすか")
+    parser.add_argument("--min-time", type=float, default=0.2, help="1項目あたりの計測時間の目安（秒）")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default="", help="名前にこの文字列を含む項目だけを計測する")
+    args = parser.parse_args()
+
+    saved = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            saved = json.load(f)
+    environment = {'python': platform.python_version(), 'machine': platform.machine()}
+    if args.update_baseline and args.filter and saved and \
+            any(saved.get(key) != value for key, value in environment.items()):
+        # 別の環境で測った値と混ざらないよう、一部だけの書き換えは同じ環境でのみ行う
+        sys.exit(f"baseline was recorded on python {saved.get('python')} / {saved.get('machine')}; "
+                 f"rerun --update-baseline without --filter to replace it")
+    baseline = saved.get('results', {})
+
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<45} {'µs/op':>12} {'alloc KB':>10} {'vs base':>8}")
+    for name, fn in build_cases(random.Random(SEED)).items():
+        if args.filter not in name:
+            continue
+        result = results[name] = measure(fn, args.min_time, args.repeat)
+        ratio = ""
+        if name in baseline:
+            change = result['us_per_op'] / baseline[name]['us_per_op']
+            ratio = f"{change:.2f}x"
+            if change > args.tolerance:
+                regressions.append(name)
+        print(f"{name:<45} {result['us_per_op']:>12.3f} {result['alloc_kb']:>10.2f} {ratio:>8}")
+
+    if args.update_baseline:
+        if args.filter:
+            # 計測しなかった項目は既存の値を残す
+            results = {**baseline, **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**environment, 'results': results}, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"baseline written to {args.baseline} ({len(results)} cases)")
+    elif regressions:
+        print(f"regressions (>{args.tolerance}x baseline): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
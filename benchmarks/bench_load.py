@@ -0,0 +1,155 @@
+"""ローカルのGeminiの代役を使った同時セッションの負荷試験
+
+    python benchmarks/bench_load.py [--sessions 8] [--turns 4] [--ramp-up 10] [--quota-error-rate 0.1] [--response-cache]
+
+Streamlit の AppTest でアプリを N セッション分並行して実行し、各セッションで
+相談の送信→応答の完了、まとめの生成、フィードバックの送信までを行う。
+1ターン（送信から応答が会話履歴に入るまで）の p50 / p95 / p99 と、全体のスループットを表示する。
+APIキー・ネットワークは不要（CHAT_LLM_BACKEND=fake、会話は保存しない）。
+--response-cache を付けると、各セッションの最初の発言を定型的な書き出しにして応答キャッシュを有効にし、
+ヒット率と節約したAPI呼び出し回数を表示する。
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+os.environ['CHAT_LLM_BACKEND'] = 'fake'
+os.environ.setdefault('CHAT_STORAGE', 'none')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fake_gemini  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "streamlit_app.py")
+MESSAGES = [
+    "最近テスト勉強で疲れていて、夜も眠れません。",
+    "友達との関係で悩んでいます。どうすればいいですか？",
+    "部活の先輩が厳しくて、行くのがつらいです。",
+    "進路のことで迷っていて、誰かに話を聞いてほしいです。",
+    "家でも学校でも居場所がない気がします。",
+]
+# --response-cache のときの最初の発言
+OPENERS = ["相談したいです", "話を聞いてほしい", "こんにちは", "相談したいです。", "話を聞いて"]
+POLL_INTERVAL = 0.1
+
+# AppTest はスクリプトの実行中にプロセス全体の状態を差し替えるため、実行（再描画）は1つずつ行う。
+# 応答・まとめの生成は実際のアプリと同じく共有のワーカープールで並行して進む
+RUN_LOCK = threading.Lock()
+
+
+def run(step) -> None:
+    with RUN_LOCK:
+        step()
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def wait_for(at: AppTest, condition, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("応答が完了しませんでした")
+        time.sleep(POLL_INTERVAL)
+        run(at.run)
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+
+
+def run_session(index: int, turns: int, shared_key: bool, openers: bool, timeout: float, results: dict) -> None:
+    turn_latencies = []
+    errors = []
+    try:
+        with RUN_LOCK:
+            at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        # 無料枠の制限はAPIキーごとのため、既定ではセッションごとに別のキーとする
+        at.session_state.api_key = "load-test" if shared_key else f"load-test-{index}"
+        at.session_state.api_key_set = True
+        run(at.run)
+
+        for turn in range(turns):
+            expected = len(at.session_state.chat_history) + 2
+            started = time.perf_counter()
+            if openers and turn == 0:
+                message = OPENERS[index % len(OPENERS)]
+            else:
+                message = MESSAGES[(index + turn) % len(MESSAGES)]
+            run(lambda: at.chat_input[0].set_value(message).run())
+            wait_for(at, lambda: len(at.session_state.chat_history) >= expected and not at.session_state.jobs, timeout)
+            turn_latencies.append(time.perf_counter() - started)
+
+        # まとめの生成
+        run(lambda: at.button[0].click().run())
+        wait_for(at, lambda: 'summary' not in at.session_state.jobs, timeout)
+
+        # 最新の応答へのフィードバック
+        last = len(at.session_state.chat_history) - 1
+        run(lambda: at.button(key=f"submit_{last}").click().run())
+        if len(at.session_state.feedback_data) != 1:
+            errors.append("feedback was not recorded")
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+    results[index] = (turn_latencies, errors)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--shared-key", action="store_true", help="全セッションで同じAPIキー（同じ利用枠）を使う")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="代役の応答時間の倍率")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="全セッションを開始し終えるまでの秒数（既定は同時に開始）")
+    parser.add_argument("--response-cache", action="store_true", help="最初の一言への応答キャッシュを有効にする")
+    args = parser.parse_args()
+    if args.response_cache:
+        # アプリが response_cache を読み込む前に設定する
+        os.environ['CHAT_RESPONSE_CACHE'] = '1'
+
+    for profile in fake_gemini.DEFAULT_PROFILES.values():
+        profile.latency *= args.latency_scale
+        profile.chunk_interval *= args.latency_scale
+    fake_gemini.configure(quota_error_rate=args.quota_error_rate, failure_rate=args.failure_rate)
+
+    results: dict = {}
+    threads = [threading.Thread(target=run_session,
+                                args=(i, args.turns, args.shared_key, args.response_cache, args.timeout, results))
+               for i in range(args.sessions)]
+    started = time.perf_counter()
+    for i, thread in enumerate(threads):
+        if args.ramp_up and i:
+            time.sleep(args.ramp_up / len(threads))
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for turn_latencies, _ in results.values() for latency in turn_latencies]
+    errors = [error for _, session_errors in results.values() for error in session_errors]
+    print(f"sessions {args.sessions}  turns/session {args.turns}  completed turns {len(latencies)}  "
+          f"elapsed {elapsed:.1f}s  throughput {len(latencies) / elapsed:.2f} turns/sec")
+    if latencies:
+        print(f"turn latency  p50 {percentile(latencies, 50):.3f}s  p95 {percentile(latencies, 95):.3f}s  "
+              f"p99 {percentile(latencies, 99):.3f}s  mean {statistics.mean(latencies):.3f}s")
+    if args.response_cache:
+        from response_cache import RESPONSE_CACHE
+        stats = RESPONSE_CACHE.stats()
+        print(f"response cache  hit rate {stats['hit_rate']:.0%} ({stats['hits']}/{stats['lookups']})  "
+              f"API requests saved {stats['requests_saved']}  skipped {stats['skipped']}")
+    for error in errors:
+        print(f"error: {error}")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
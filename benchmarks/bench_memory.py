@@ -0,0 +1,96 @@
+"""会話履歴1セッションあたりのメモリ使用量を計測する
+
+    python benchmarks/bench_memory.py [--turns 100 500 2000] [--max-in-memory 200]
+
+同じ会話（ユーザー発言と、メタデータ付きの応答の組）を、
+  list       これまでの dict のリスト
+  store      MessageStore（コンパクトなレコード＋上限を超えた分は一時ファイルへ退避）
+で保持した場合の、tracemalloc で測った確保量（KB）と、履歴の全件走査・直近の読み出しの時間を比較する。
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from message_store import MessageStore  # noqa: E402
+from prompts import get_crisis_card  # noqa: E402
+
+SENTENCES = [
+    "最近テスト勉強で疲れていて、夜もなかなか眠れません。",
+    "友達とけんかしてしまって、どうやって謝ればいいかわからないです。",
+    "部活の先輩が厳しくて、毎日行くのがつらいです。",
+    "そうだったんですね。眠れない日が続くのはつらいですよね。",
+]
+
+
+def make_messages(turns: int) -> List[Dict]:
+    """保存先から読み込んだ場合と同じく、各メッセージが別々の文字列・リストを持つ会話"""
+    started = datetime.datetime(2024, 6, 1, 20, 0)
+    messages = []
+    for i in range(turns):
+        moment = started + datetime.timedelta(minutes=i)
+        messages.append({'role': 'user', 'content': "".join(SENTENCES[(i + j) % 3] for j in range(2)) + str(i),
+                         'timestamp': moment.isoformat()})
+        risk_level = 4 if i % 10 == 0 else 2
+        messages.append({
+            'role': 'assistant',
+            'content': SENTENCES[3] * 3 + str(i),
+            'timestamp': (moment + datetime.timedelta(seconds=5)).isoformat(),
+            'risk_level': risk_level,
+            'needs_type': "".join(['listen', 'ing']),
+            'detected_keywords': ["".join(['眠れ', 'ない']), "".join(['疲れ', 'た'])],
+            'crisis_card': "".join(get_crisis_card(risk_level) or '') or None,
+            'model': "".join(['gemini-2.5-', 'flash']),
+            'time_to_first_token': 0.8,
+            'response_time': 2.4,
+        })
+    return messages
+
+
+def allocated_kb(build: Callable[[], object]) -> float:
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    kept = build()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return (after - before) / 1024
+
+
+def timed_ms(fn: Callable[[], object], repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--max-in-memory", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'turns':>6} {'kind':<6} {'alloc KB':>10} {'scan ms':>9} {'last 30 ms':>11}")
+    for turns in args.turns:
+        variants = {
+            'list': lambda: make_messages(turns),
+            'store': lambda: MessageStore(make_messages(turns), max_in_memory=args.max_in_memory),
+        }
+        for kind, build in variants.items():
+            kb = allocated_kb(build)
+            history = build()
+            scan = timed_ms(lambda: sum(len(message['content']) for message in history))
+            recent = timed_ms(lambda: [dict(message) for message in history[-30:]])
+            print(f"{turns:>6} {kind:<6} {kb:>10.1f} {scan:>9.2f} {recent:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
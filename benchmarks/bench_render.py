@@ -0,0 +1,82 @@
+"""会話履歴の長さごとの再描画（rerun）時間を計測する
+
+    python benchmarks/bench_render.py [--repeat 5]
+
+Streamlit の AppTest でアプリを実行し、履歴が 10 / 100 / 1000 件の場合の
+1回あたりのスクリプト実行時間を、ページ分割あり（既定）と全件描画とで比較する。
+APIキー入力後の画面を対象とし、ネットワーク通信は発生しない。
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from message_store import MessageStore  # noqa: E402
+from risk_tracker import RiskTracker  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "streamlit_app.py")
+SIZES = (10, 100, 1000)
+# chat_page.HISTORY_PAGE_SIZE と同じ（ページ分割時に描画される件数）
+PAGE_SIZE = 30
+
+
+def make_history(n: int):
+    history = []
+    for i in range(n):
+        if i % 2 == 0:
+            history.append({'role': 'user', 'content': f"最近{i}日くらい眠れなくて、勉強にも集中できません。",
+                            'timestamp': datetime.datetime.now().isoformat()})
+        else:
+            history.append({'role': 'assistant', 'content': "そうだったんですね。眠れない日が続くのはつらいですよね。" * 3,
+                            'timestamp': datetime.datetime.now().isoformat(), 'risk_level': 3,
+                            'needs_type': 'listening', 'detected_keywords': ['眠れない']})
+    return history
+
+
+def measure(n: int, paginate: bool, repeat: int) -> float:
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.session_state.api_key = "benchmark"
+    at.session_state.api_key_set = True
+    # セッションを作成済みの状態にしておく（session_id がないと新しいセッションとして履歴が空になる）
+    history = make_history(n)
+    at.session_state.session_id = "benchmark"
+    at.session_state.chat_history = MessageStore(history)
+    at.session_state.feedback_data = []
+    at.session_state.risk_tracker = RiskTracker.replay(history)
+    visible = n if not paginate else PAGE_SIZE
+    if not paginate:
+        at.session_state.visible_messages = n
+    at.run()  # 初回（モジュール読み込み等）は除外
+    if len(at.chat_message) != min(n, visible):
+        raise RuntimeError(f"{len(at.chat_message)} messages rendered, expected {min(n, visible)}")
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - started)
+    if at.exception:
+        raise RuntimeError(at.exception)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'messages':>8} | {'paginated (ms)':>14} | {'all (ms)':>9}")
+    for n in SIZES:
+        paginated = measure(n, True, args.repeat) * 1000
+        full = measure(n, False, args.repeat) * 1000
+        print(f"{n:>8} | {paginated:>14.1f} | {full:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""リスク判定（キーワード一致のみ / 意味的判定との併用）の精度と速度を計測する
+
+    python benchmarks/bench_semantic.py [--fixture benchmarks/fixtures/risk_labels.jsonl] [--sweep]
+
+ラベル付きの相談文（危険な表現に似た言い回しを含む安全な文も含む）に対する完全一致率と、
+レベル5（119番の案内）・レベル4以上（危機カード）・レベル3以上それぞれの適合率（precision）・検出率（recall）、
+1ターンあたりの判定時間、まとめて判定する場合のスループットを表示する。
+--sweep では semantic.RISK_THRESHOLDS の候補を総当たりし、成績の良い組み合わせを表示する。
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from typing import List, Sequence, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analysis  # noqa: E402
+import semantic  # noqa: E402
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "risk_labels.jsonl")
+HIGH_RISK = 4
+
+
+def load_fixture(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def precision_recall(labels: Sequence[int], predicted: Sequence[int], cutoff: int) -> Tuple[float, float, int]:
+    """レベル cutoff 以上を陽性とみなした適合率・検出率と、誤検出の件数"""
+    true_positives = sum(p >= cutoff and l >= cutoff for p, l in zip(predicted, labels))
+    flagged = sum(p >= cutoff for p in predicted)
+    positives = sum(l >= cutoff for l in labels)
+    precision = true_positives / flagged if flagged else 1.0
+    recall = true_positives / positives if positives else 1.0
+    return precision, recall, flagged - true_positives
+
+
+def report_accuracy(name: str, rows, predicted) -> None:
+    labels = [row["risk_level"] for row in rows]
+    exact = sum(p == l for p, l in zip(predicted, labels))
+    line = f"{name:<10} exact {exact}/{len(rows)} ({exact / len(rows):.0%})"
+    for cutoff in (5, HIGH_RISK, 3):
+        precision, recall, false_alarms = precision_recall(labels, predicted, cutoff)
+        line += f"  ≥{cutoff}: precision {precision:.0%} recall {recall:.0%} (誤検出 {false_alarms})"
+    print(line)
+
+
+def f1(precision: float, recall: float) -> float:
+    if not precision and not recall:
+        return 0.0
+    return 2 * precision * recall / (precision + recall)
+
+
+def sweep(rows, results, top: int = 5) -> None:
+    """RISK_THRESHOLDS の候補を総当たりし、レベル4以上のF1、レベル3以上のF1の順に良いものを表示する
+
+    同点の場合は現在の値からの変更が小さいものを優先する（データの無い範囲で値を動かさない）。
+    """
+    current = semantic.RISK_THRESHOLDS
+    scorer = analysis.get_semantic_scorer()
+    labels = [row["risk_level"] for row in rows]
+    keyword_levels = [r.keyword_level for r in results]
+    similarities = scorer.similarities_batch([row["text"] for row in rows])
+    grid = [round(0.5 + 0.05 * i, 2) for i in range(11)]
+    ranked: List[Tuple] = []
+    for high, mid, low in itertools.product(grid, repeat=3):
+        thresholds = {5: high, 4: mid, 3: low}
+        semantic_levels = scorer.levels_with(similarities, thresholds).tolist()
+        predicted = [analysis.combine_levels(k, s) for k, s in zip(keyword_levels, semantic_levels)]
+        high_risk = precision_recall(labels, predicted, HIGH_RISK)
+        elevated = precision_recall(labels, predicted, 3)
+        change = sum(abs(thresholds[level] - current[level]) for level in thresholds)
+        key = (f1(*high_risk[:2]), f1(*elevated[:2]), -change)
+        ranked.append((key, thresholds, high_risk, elevated))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    for _, thresholds, high_risk, elevated in ranked[:top]:
+        print(f"  {thresholds}  ≥{HIGH_RISK}: P {high_risk[0]:.0%} R {high_risk[1]:.0%}  "
+              f"≥3: P {elevated[0]:.0%} R {elevated[1]:.0%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixture", default=FIXTURE_PATH)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--sweep", action="store_true", help="RISK_THRESHOLDS の候補を総当たりする")
+    args = parser.parse_args()
+
+    rows = load_fixture(args.fixture)
+    texts = [row["text"] for row in rows]
+
+    results = analysis.analyze_texts(texts)
+    report_accuracy("keyword", rows, [r.keyword_level for r in results])
+    report_accuracy("combined", rows, [r.risk_level for r in results])
+    for row, result in zip(rows, results):
+        if result.risk_level != row["risk_level"]:
+            print(f"  miss: {row['text']!r} label={row['risk_level']} "
+                  f"keyword={result.keyword_level} semantic={result.semantic_level}")
+    if args.sweep:
+        print(f"sweep (現在の RISK_THRESHOLDS: {semantic.RISK_THRESHOLDS})")
+        sweep(rows, results)
+        return
+
+    turn = "最近学校に行くのがしんどくて、夜もなかなか眠れないんです。どうすればいいですか"
+    for name, enabled in (("keyword", False), ("combined", True)):
+        analysis.USE_SEMANTIC_SCORER = enabled
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            analysis.analyze_text(turn)
+        per_turn = (time.perf_counter() - started) / args.repeat * 1000
+        print(f"{name:<10} per turn {per_turn:.3f} ms")
+    analysis.USE_SEMANTIC_SCORER = True
+
+    batch = texts * 200
+    started = time.perf_counter()
+    analysis.analyze_texts(batch)
+    elapsed = time.perf_counter() - started
+    print(f"batch      {len(batch)} messages in {elapsed:.2f}s ({len(batch) / elapsed:.0f} messages/sec)")
+
+
+if __name__ == "__main__":
+    main()
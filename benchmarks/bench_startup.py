@@ -0,0 +1,68 @@
+"""起動時間（モジュールのインポートと最初の描画まで）を計測する
+
+    python benchmarks/bench_startup.py [--repeat 5]
+
+毎回新しいPythonプロセスで、
+  import   アプリが読み込むモジュール（streamlit を除く）のインポート時間
+  first    AppTest での最初の実行（APIキー入力画面の描画）までの時間（streamlit のインポートを除く）
+  chat     APIキー設定済みの画面での最初の実行までの時間
+を測り、中央値を表示する。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 計測用の子プロセスで実行するコード
+CHILD = r"""
+import json, os, sys, time, warnings
+warnings.simplefilter("ignore")
+sys.path.insert(0, {root!r})
+import streamlit
+from streamlit.testing.v1 import AppTest
+mode = {mode!r}
+started = time.perf_counter()
+if mode == "import":
+    {imports}
+else:
+    at = AppTest.from_file(os.path.join({root!r}, "streamlit_app.py"), default_timeout=60)
+    if mode == "chat":
+        at.session_state.api_key = "benchmark"
+        at.session_state.api_key_set = True
+    at.run()
+    assert not at.exception, at.exception
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "sdk_loaded": "google.generativeai" in sys.modules,
+                   "numpy_loaded": "numpy" in sys.modules}}))
+"""
+
+# アプリ（chat_page.py）が先頭で読み込むモジュール
+APP_MODULES = ["metrics", "analysis", "context", "gemini_client", "fallback", "jobs", "prompts",
+               "message_store", "quota", "response_cache", "risk_tracker", "storage", "summary"]
+
+
+def measure(mode: str) -> dict:
+    code = CHILD.format(root=ROOT, mode=mode, imports="; ".join(f"import {name}" for name in APP_MODULES))
+    env = dict(os.environ, CHAT_STORAGE="none", PYTHONWARNINGS="ignore")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, cwd=ROOT, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for mode in ("import", "first", "chat"):
+        results = [measure(mode) for _ in range(args.repeat)]
+        seconds = statistics.median(result["seconds"] for result in results)
+        print(f"{mode:<7} {seconds * 1000:8.1f} ms  (SDK loaded: {results[-1]['sdk_loaded']}, "
+              f"numpy loaded: {results[-1]['numpy_loaded']})")
+
+
+if __name__ == "__main__":
+    main()
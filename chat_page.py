@@ -0,0 +1,515 @@
+import streamlit as st
+import datetime
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+import metrics
+from analysis import analyze_text, get_semantic_scorer
+from context import ContextBuilder
+from gemini_client import (LLM_BACKEND, MAX_API_KEYS, MODEL_REGISTRY, generate_conversation_summary, load_sdk,
+                           stream_ai_response_gemini)
+from fallback import FallbackEngine
+from jobs import Job, JobPool
+from message_store import MessageStore
+from prompts import get_crisis_card
+from quota import QuotaScheduler
+from response_cache import RESPONSE_CACHE, CachedResponse
+from risk_tracker import RiskTracker
+from storage import AsyncWriter, open_storage
+from summary import SummaryCache
+
+# 再描画1回あたりの所要時間の計測開始
+_render_started = time.perf_counter()
+
+# ページ設定
+st.set_page_config(
+    page_title="学生相談支援システム",
+    page_icon="💭",
+    layout="centered"
+)
+
+
+# 一度に表示する会話履歴の件数（長い会話でも再描画の負荷を一定に保つ）
+HISTORY_PAGE_SIZE = 30
+
+
+@st.cache_resource(max_entries=MAX_API_KEYS)
+def get_fallback_engine(api_key: str) -> FallbackEngine:
+    """同じAPIキーを使う全セッションで共有するフォールバック実行器（レート制限・遮断状態を含む）"""
+    return FallbackEngine(scheduler=QuotaScheduler())
+
+
+@st.cache_resource
+def get_job_pool() -> JobPool:
+    """全セッションで共有する生成処理のワーカープール"""
+    return JobPool()
+
+
+@st.cache_resource
+def get_storage() -> Optional[AsyncWriter]:
+    """全セッションで共有する会話履歴・フィードバックの保存先"""
+    return open_storage()
+
+
+@st.cache_resource
+def warm_up() -> threading.Thread:
+    """応答生成で使う重いモジュール（Gemini SDK・NumPy）を、初回の描画後にバックグラウンドで読み込む"""
+    def load() -> None:
+        if LLM_BACKEND == 'gemini':
+            load_sdk()
+        get_semantic_scorer()
+    thread = threading.Thread(target=load, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def start_session(session_id: Optional[str] = None) -> bool:
+    """新しいセッションを始める。session_id（再開コード）を渡した場合は保存済みの会話を読み込む
+
+    再開コードは利用者が入力したときだけ使い、URLなどには載せない。
+    一致する会話がなければ現在のセッションをそのまま続け、False を返す。
+    """
+    storage = get_storage()
+    chat_history, feedback_data = [], []
+    if session_id:
+        if storage is not None:
+            chat_history, feedback_data = storage.load_session(session_id)
+        if not chat_history:
+            return False
+    else:
+        session_id = uuid.uuid4().hex
+    st.session_state.session_id = session_id
+    st.session_state.chat_history = MessageStore(chat_history)
+    st.session_state.feedback_data = feedback_data
+    st.session_state.risk_tracker = RiskTracker.replay(chat_history)
+    return True
+
+
+def reset_conversation_state() -> None:
+    """セッションを切り替えたときに、前の会話に紐づく表示・生成中の処理を破棄する"""
+    st.session_state.summary = None
+    st.session_state.summary_cache = SummaryCache()
+    st.session_state.context_builder = ContextBuilder()
+    st.session_state.jobs = {}
+    st.session_state.visible_messages = HISTORY_PAGE_SIZE
+    st.session_state.reply_error = None
+    st.session_state.show_summary = False
+
+
+def append_message(message: Dict) -> None:
+    """会話履歴にメッセージを追加し、バックグラウンドで保存"""
+    st.session_state.chat_history.append(message)
+    storage = get_storage()
+    if storage is not None:
+        storage.save_message(st.session_state.session_id, len(st.session_state.chat_history) - 1, message)
+
+
+def finish_reply(job: Job) -> None:
+    """完了した応答生成の結果を会話履歴に追加"""
+    st.session_state.jobs.pop('reply', None)
+    if job.error is not None:
+        # 生成処理そのものが失敗した場合は、空の応答を会話履歴に残さず（保存・キャッシュもしない）エラーを表示する
+        st.session_state.reply_error = {
+            'crisis_card': job.meta['crisis_card'],
+            'content': f"予期しないエラーが発生しました: {str(job.error)[:150]}\n\nAPIキーが正しいか確認してください。"
+        }
+        return
+    response_stream = job.progress
+    append_message({
+        'role': 'assistant',
+        'content': response_stream.text,
+        'timestamp': datetime.datetime.now().isoformat(),
+        'risk_level': job.meta['risk_level'],
+        'needs_type': job.meta['needs_type'],
+        'detected_keywords': job.meta['detected_keywords'],
+        'crisis_card': job.meta['crisis_card'],
+        'model': response_stream.model_name,
+        'time_to_first_token': response_stream.time_to_first_token,
+        'response_time': response_stream.total_time
+    })
+    cache_key = job.meta.get('cache_key')
+    if cache_key is not None and not isinstance(response_stream, CachedResponse) and response_stream.last_error is None:
+        RESPONSE_CACHE.store(cache_key, response_stream.text)
+    metrics.maybe_export()
+
+
+def finish_summary(job: Job) -> None:
+    """完了したまとめ生成の結果を表示対象にする"""
+    st.session_state.jobs.pop('summary', None)
+    st.session_state.summary = job.result if job.error is None else f"まとめの生成中にエラーが発生しました: {str(job.error)[:150]}"
+    st.session_state.show_summary = True
+
+
+@st.fragment
+def show_feedback(message_index: int) -> None:
+    """応答への評価（操作してもこの部分だけが再実行される）"""
+    with st.expander("この応答は役に立ちましたか？"):
+        col1, col2 = st.columns([1, 2])
+        with col1:
+            rating = st.select_slider(
+                "評価", 
+                options=[1, 2, 3, 4, 5],
+                value=3,
+                key=f"rating_{message_index}"
+            )
+        with col2:
+            if st.button("👍 送信", key=f"submit_{message_index}", use_container_width=True):
+                feedback = {
+                    'message_id': message_index,
+                    'rating': rating,
+                    'timestamp': datetime.datetime.now().isoformat()
+                }
+                st.session_state.feedback_data.append(feedback)
+                storage = get_storage()
+                if storage is not None:
+                    storage.save_feedback(st.session_state.session_id, feedback)
+                st.success("ありがとうございます！")
+
+
+@st.fragment(run_every=0.5)
+def show_pending_reply() -> None:
+    """生成中の応答を、届いた部分から定期的に表示"""
+    job = st.session_state.jobs.get('reply')
+    if job is None:
+        return
+    if job.done:
+        finish_reply(job)
+        st.rerun(scope="app")
+    with st.chat_message("assistant", avatar="💭"):
+        # 高リスクの場合は応答を待たずに緊急連絡先を先に表示
+        if job.meta['crisis_card']:
+            st.error(job.meta['crisis_card'])
+        if job.progress.text:
+            st.write(job.progress.text)
+        else:
+            st.caption("考えています...")
+
+
+@st.fragment(run_every=0.5)
+def show_pending_summary() -> None:
+    """まとめの生成完了を待って表示"""
+    job = st.session_state.jobs.get('summary')
+    if job is None:
+        return
+    if job.done:
+        finish_summary(job)
+        st.rerun(scope="app")
+    st.caption("📝 会話をまとめています...")
+
+
+# セッション状態の初期化
+if 'session_id' not in st.session_state:
+    start_session()
+if 'session' in st.query_params:
+    # 以前の版で共有されたURLのセッションIDは読み込まず、アドレスバー・履歴からも消す
+    del st.query_params['session']
+if 'api_key_set' not in st.session_state:
+    st.session_state.api_key_set = False
+if 'show_info' not in st.session_state:
+    st.session_state.show_info = False
+if 'summary' not in st.session_state:
+    st.session_state.summary = None
+if 'show_summary' not in st.session_state:
+    st.session_state.show_summary = False
+if 'summary_cache' not in st.session_state:
+    st.session_state.summary_cache = SummaryCache()
+if 'context_builder' not in st.session_state:
+    st.session_state.context_builder = ContextBuilder()
+if 'jobs' not in st.session_state:
+    st.session_state.jobs = {}
+if 'visible_messages' not in st.session_state:
+    st.session_state.visible_messages = HISTORY_PAGE_SIZE
+if 'reply_error' not in st.session_state:
+    st.session_state.reply_error = None
+
+# UI構築
+st.title("💭 学生相談支援システム")
+
+# APIキー入力エリア
+if not st.session_state.api_key_set:
+    st.info("🔑 Google Gemini APIキーを入力してください")
+    
+    st.success("""
+    **2025年1月時点の無料枠情報:**
+    - 使用モデル: Gemini 2.5 Flash / Flash-Lite
+    - Flash-Lite: 1日1,000リクエストまで（高速）
+    - Flash: 1日250リクエストまで（高品質）
+    - クレジットカード不要
+    
+    学生相談に十分な容量です！
+    """)
+    
+    api_key_input = st.text_input(
+        "APIキー", 
+        type="password",
+        help="APIキーはGoogle AI Studioで取得できます"
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("APIキーを設定", type="primary", use_container_width=True):
+            if api_key_input:
+                previous_key = st.session_state.get('api_key')
+                if previous_key and previous_key != api_key_input:
+                    # 変更前のキーで生成したモデル・クライアントを手放す
+                    MODEL_REGISTRY.evict(previous_key)
+                st.session_state.api_key = api_key_input
+                st.session_state.api_key_set = True
+                st.rerun()
+            else:
+                st.error("APIキーを入力してください")
+    
+    with col2:
+        st.link_button(
+            "APIキーを取得",
+            "https://aistudio.google.com/app/apikey",
+            use_container_width=True
+        )
+    
+    st.markdown("---")
+    st.markdown("""
+    ### 📱 このシステムについて
+    
+    学生の皆さんが安心して相談できる場を提供します。
+    
+    **特徴:**
+    - ✅ AIによる傾聴と支援
+    - ✅ あなたのニーズに合わせた応答
+    - ✅ 必要に応じて専門家への連携
+    
+    **注意事項:**
+    - ⚠️ このシステムは専門的な医療やカウンセリングの代替ではありません
+    - ⚠️ 緊急時は必ず専門家にご相談ください
+    - 🔒 相談内容は安全に管理されます
+    """)
+    
+else:
+    # メインチャットエリア
+    
+    # バックグラウンドで完了済みの生成結果を反映
+    for kind, finish in (('reply', finish_reply), ('summary', finish_summary)):
+        job = st.session_state.jobs.get(kind)
+        if job is not None and job.done:
+            finish(job)
+    
+    # トップバーメニュー
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+    with col1:
+        st.markdown("### 💬 相談窓口")
+    with col2:
+        if st.button("📝 まとめ", use_container_width=True, disabled=len(st.session_state.chat_history) < 2):
+            if len(st.session_state.chat_history) >= 2:
+                # 応答生成と並行してバックグラウンドでまとめる（連打は実行中の処理にまとめる）
+                get_job_pool().submit_once(
+                    st.session_state.jobs,
+                    Job('summary'),
+                    generate_conversation_summary,
+                    st.session_state.chat_history[:],
+                    st.session_state.api_key,
+                    engine=get_fallback_engine(st.session_state.api_key),
+                    cache=st.session_state.summary_cache
+                )
+    with col3:
+        if st.button("ℹ️ 情報", use_container_width=True):
+            st.session_state.show_info = not st.session_state.show_info
+    with col4:
+        if st.button("🔄 リセット", use_container_width=True):
+            start_session()
+            reset_conversation_state()
+            st.rerun()
+    
+    # 情報パネル（トグル表示）
+    if st.session_state.show_info:
+        with st.expander("📊 システム情報", expanded=True):
+            if st.session_state.chat_history:
+                last_message = st.session_state.chat_history[-1]
+                if last_message['role'] == 'assistant':
+                    needs_labels = {
+                        'listening': '傾聴重視',
+                        'solution': '解決策提示',
+                        'thinking': '共に考える'
+                    }
+                    st.info(f"**検出ニーズ:** {needs_labels.get(last_message.get('needs_type', 'listening'))}")
+                    tracker = st.session_state.risk_tracker
+                    trend_labels = {'rising': '上昇', 'falling': '低下', 'stable': '横ばい'}
+                    st.caption(f"リスクレベル {tracker.level}（最高 {tracker.peak_level}、傾向: {trend_labels[tracker.trend]}）")
+                    if last_message.get('time_to_first_token') is not None:
+                        st.caption(f"応答開始まで {last_message['time_to_first_token']:.2f}秒 / 全体 {last_message['response_time']:.2f}秒（{last_message['model']}）")
+
+            history = st.session_state.chat_history
+            if isinstance(history, MessageStore) and history:
+                st.caption(f"会話履歴 {len(history)}件（メモリ上 約{history.memory_usage() / 1024:.0f}KB、"
+                           f"一時ファイルへ退避 {history.spilled}件）")
+
+            if get_storage() is not None:
+                st.caption("この会話の再開コード（後で続きから話すときに入力します。他の人には見せないでください）")
+                st.code(st.session_state.session_id, language=None)
+                with st.form("resume", clear_on_submit=True):
+                    resume_code = st.text_input("以前の会話を再開する", type="password", placeholder="再開コードを入力")
+                    if st.form_submit_button("再開") and resume_code.strip():
+                        if start_session(resume_code.strip()):
+                            reset_conversation_state()
+                            st.rerun()
+                        st.error("再開コードに一致する会話が見つかりませんでした")
+
+            if RESPONSE_CACHE is not None:
+                cache_stats = RESPONSE_CACHE.stats()
+                st.caption(f"応答キャッシュ（全セッション）: ヒット率 {cache_stats['hit_rate']:.0%}"
+                           f"（{cache_stats['hits']}/{cache_stats['lookups']}件）、"
+                           f"節約したAPI呼び出し {cache_stats['requests_saved']}回")
+            
+            if metrics.ENABLED:
+                # 計測値（全セッションの合計）
+                snapshot = metrics.REGISTRY.snapshot()
+                if snapshot['spans']:
+                    st.caption("処理段階ごとの所要時間（秒）")
+                    st.dataframe(snapshot['spans'], hide_index=True, use_container_width=True)
+                if snapshot['counters']:
+                    st.caption("モデルごとの試行回数")
+                    st.dataframe(snapshot['counters'], hide_index=True, use_container_width=True)
+            
+            st.warning("""
+            **緊急時の連絡先:**
+            - いのちの電話: 0120-783-556
+            - 学校のカウンセラー
+            - 保健室の先生
+            """)
+            
+            if st.button("APIキーを変更"):
+                st.session_state.api_key_set = False
+                st.rerun()
+    
+    if 'summary' in st.session_state.jobs:
+        show_pending_summary()
+    
+    # まとめ表示パネル
+    if st.session_state.show_summary and st.session_state.summary:
+        with st.expander("📝 会話のまとめ", expanded=True):
+            st.markdown(st.session_state.summary)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("✅ 閉じる", use_container_width=True):
+                    st.session_state.show_summary = False
+                    st.rerun()
+            with col2:
+                st.download_button(
+                    "💾 保存",
+                    data=st.session_state.summary,
+                    file_name=f"counseling_summary_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                    mime="text/plain",
+                    use_container_width=True
+                )
+    
+    st.markdown("---")
+    
+    # ユーザー入力（画面下部に固定、応答の生成中は受け付けない）
+    user_input = st.chat_input("相談内容を入力してください...", disabled='reply' in st.session_state.jobs)
+
+    if user_input and 'reply' not in st.session_state.jobs:
+        st.session_state.reply_error = None
+        # ユーザーメッセージを追加
+        append_message({
+            'role': 'user',
+            'content': user_input,
+            'timestamp': datetime.datetime.now().isoformat()
+        })
+        
+        # リスクレベル判定・ニーズ分析（1回の走査で両方を判定）
+        with metrics.span('analyze'):
+            analysis = analyze_text(user_input)
+        detected_keywords = analysis.detected_keywords
+        needs_type = analysis.needs_type
+        # これまでの発言の兆候の蓄積も踏まえたレベルで応答する
+        risk_level = st.session_state.risk_tracker.update_from(analysis, datetime.datetime.now().timestamp())
+        
+        # 会話の最初の定型的な一言には、蓄えた応答を返して利用枠を節約する（リスクレベル3以上は対象外）
+        cache_key = cached_text = None
+        if RESPONSE_CACHE is not None:
+            cache_key = RESPONSE_CACHE.key_for(user_input, risk_level, needs_type, st.session_state.chat_history)
+            if cache_key is not None:
+                cached_text = RESPONSE_CACHE.lookup(cache_key)
+        
+        if cached_text is not None:
+            response_stream = CachedResponse(cached_text)
+        else:
+            # AI応答生成（Gemini使用）をバックグラウンドで開始
+            response_stream = stream_ai_response_gemini(
+                user_input, 
+                risk_level, 
+                needs_type,
+                st.session_state.chat_history[:],
+                st.session_state.api_key,
+                engine=get_fallback_engine(st.session_state.api_key),
+                context=st.session_state.context_builder
+            )
+        get_job_pool().submit_once(
+            st.session_state.jobs,
+            Job(
+                'reply',
+                progress=response_stream,
+                risk_level=risk_level,
+                needs_type=needs_type,
+                detected_keywords=detected_keywords,
+                crisis_card=get_crisis_card(risk_level),
+                cache_key=cache_key
+            ),
+            "".join,
+            response_stream
+        )
+        
+        st.rerun()
+    
+    # チャット履歴表示
+    chat_container = st.container()
+    with chat_container:
+        if not st.session_state.chat_history:
+            st.info("👋 こんにちは。何でもお話しください。あなたの話を聞かせてください。")
+        
+        # 直近の HISTORY_PAGE_SIZE 件だけを描画し、それ以前はボタンで遡って表示
+        history = st.session_state.chat_history
+        start = max(0, len(history) - st.session_state.visible_messages)
+        if start > 0:
+            if st.button(f"⬆️ 以前のメッセージを表示（残り{start}件）", key="show_earlier", use_container_width=True):
+                st.session_state.visible_messages += HISTORY_PAGE_SIZE
+                st.rerun()
+        
+        for i in range(start, len(history)):
+            message = history[i]
+            if message['role'] == 'user':
+                with st.chat_message("user", avatar="🙂"):
+                    st.write(message['content'])
+            else:
+                with st.chat_message("assistant", avatar="💭"):
+                    if message.get('crisis_card'):
+                        st.error(message['crisis_card'])
+                    st.write(message['content'])
+                    
+                    # フィードバック機能（最新のメッセージのみ）
+                    if i == len(history) - 1 and 'reply' not in st.session_state.jobs:
+                        show_feedback(i)
+        
+        # 直前の応答の生成に失敗した場合
+        reply_error = st.session_state.reply_error
+        if reply_error is not None and 'reply' not in st.session_state.jobs:
+            with st.chat_message("assistant", avatar="💭"):
+                if reply_error['crisis_card']:
+                    st.error(reply_error['crisis_card'])
+                st.warning(reply_error['content'])
+        
+        # 生成中の応答
+        if 'reply' in st.session_state.jobs:
+            show_pending_reply()
+    
+    st.markdown("---")
+
+# フッター
+st.markdown("---")
+st.caption("💡 このシステムは学生の相談支援を目的としています。緊急時は必ず専門家にご相談ください。")
+
+metrics.observe('render', time.perf_counter() - _render_started)
+
+# 画面を返した後で、最初の相談に備えて事前に読み込んでおく（プロセスごとに1回）
+warm_up()
@@ -0,0 +1,106 @@
+"""トークン予算内に収まる会話履歴（直近の発言＋古い発言の要点）の組み立て"""
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from quota import estimate_tokens
+
+# モデルごとのプロンプト全体のトークン予算（TPMの消費を一定に保つ）
+CONTEXT_TOKEN_BUDGETS = {
+    'gemini-2.5-flash-lite': 2500,
+    'gemini-2.5-flash': 2500,
+    'gemini-1.5-flash': 2000,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = 2000
+
+# 要点として残す古い相談者の発言の件数と、1件あたりの文字数
+MEMORY_ITEMS = 8
+EXCERPT_CHARS = 60
+MEMORY_KEYWORDS = 10
+
+
+def format_turn(msg: Dict) -> str:
+    if msg['role'] == 'user':
+        return f"相談者: {msg['content']}\n"
+    return f"AI: {msg['content']}\n"
+
+
+class ContextBuilder:
+    """セッションごとの会話履歴の組み立て役
+
+    予算に収まる限り直近の発言をそのまま入れ、収まらなくなった古い発言は
+    「要点」（相談者の発言の抜粋と、話題に出たリスクキーワードの回数）に畳み込む。
+    畳み込みは新しく予算からはみ出した発言に対してだけ行う。
+    """
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None):
+        self.budgets = budgets or CONTEXT_TOKEN_BUDGETS
+        self.clear()
+
+    def clear(self) -> None:
+        self.folded = 0  # 要点に畳み込んだメッセージ数
+        self.memory: Deque[str] = deque(maxlen=MEMORY_ITEMS)
+        self.keyword_counts: Dict[str, int] = {}
+        self._turn_tokens: List[int] = []
+        self._prefix_cache: Dict[Tuple, str] = {}
+
+    def budget_for(self, model_name: Optional[str]) -> int:
+        return self.budgets.get(model_name, DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+    def _fold(self, messages: List[Dict]) -> None:
+        for msg in messages:
+            if msg['role'] == 'user':
+                excerpt = msg['content'].replace('\n', ' ')
+                if len(excerpt) > EXCERPT_CHARS:
+                    excerpt = excerpt[:EXCERPT_CHARS] + '…'
+                self.memory.append(f"- 相談者: {excerpt}")
+            else:
+                # 応答に記録済みの検出キーワードを使い、本文は読み直さない
+                for keyword in msg.get('detected_keywords') or ():
+                    self.keyword_counts[keyword] = self.keyword_counts.get(keyword, 0) + 1
+
+    def memory_text(self) -> str:
+        """畳み込んだ古い発言の要点"""
+        if not self.memory and not self.keyword_counts:
+            return ""
+        parts = ["【これまでの会話の要点】\n"]
+        parts.extend(line + "\n" for line in self.memory)
+        if self.keyword_counts:
+            top = sorted(self.keyword_counts.items(), key=lambda item: -item[1])[:MEMORY_KEYWORDS]
+            parts.append("話題に出た気になる言葉: " + "、".join(f"{k}×{n}" for k, n in top) + "\n")
+        return "".join(parts)
+
+    def build_history(self, chat_history: List[Dict], budget: int) -> str:
+        """予算（トークン）に収まる会話履歴のテキスト"""
+        if len(chat_history) < len(self._turn_tokens):
+            # 履歴が巻き戻っている（リセット等）場合は作り直す
+            self.clear()
+        for msg in chat_history[len(self._turn_tokens):]:
+            self._turn_tokens.append(estimate_tokens(format_turn(msg)))
+
+        # 畳み込むと要点が長くなり、残した直近の発言が予算からはみ出すことがあるので、
+        # 要点の長さを測り直して収まるまで畳み込みを繰り返す
+        while True:
+            available = budget - estimate_tokens(self.memory_text())
+            start = len(chat_history)
+            used = 0
+            while start > self.folded and used + self._turn_tokens[start - 1] <= available:
+                start -= 1
+                used += self._turn_tokens[start]
+            if start <= self.folded:
+                break
+            self._fold(chat_history[self.folded:start])
+            self.folded = start
+
+        return self.memory_text() + "".join(format_turn(msg) for msg in chat_history[self.folded:])
+
+    def build_prefix(self, system_prompt: str, chat_history: List[Dict], budget: int) -> str:
+        """システムプロンプトと会話履歴をつないだプロンプトの前半（同じターン内では使い回す）"""
+        key = (len(chat_history), budget, system_prompt)
+        prefix = self._prefix_cache.get(key)
+        if prefix is None:
+            history_budget = budget - estimate_tokens(system_prompt)
+            prefix = f"{system_prompt}\n\n【会話履歴】\n{self.build_history(chat_history, history_budget)}"
+            # 直近のターンの分だけを残す
+            self._prefix_cache = {k: v for k, v in self._prefix_cache.items() if k[0] == key[0]}
+            self._prefix_cache[key] = prefix
+        return prefix
@@ -0,0 +1,180 @@
+"""APIキー・ネットワークなしで動くGeminiの代役（性能測定・負荷試験用）
+
+CHAT_LLM_BACKEND=fake で gemini_client のモデルがこちらに置き換わる。
+generate_content の応答時間はモデルごとの対数正規分布に従い、stream=True では
+チャンクを一定間隔で返す。429（利用枠超過）や一時的な障害も設定した確率・RPMで発生させる。
+"""
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+
+class FakeQuotaError(Exception):
+    """429 Resource has been exhausted の代役"""
+    code = 429
+
+
+class FakeServiceError(Exception):
+    """503 Service Unavailable の代役"""
+    code = 503
+
+
+class FakeModelProfile:
+    """モデルごとの振る舞いの設定
+
+    latency: 最初のチャンクまで（非ストリーミングでは応答全体）の秒数の中央値
+    latency_sigma: 対数正規分布のばらつき（0なら常に latency）
+    chunk_interval: ストリーミング時のチャンク間の秒数
+    chunks: ストリーミング時のチャンク数
+    quota_error_rate / failure_rate: 送信時に429・503を返す確率
+    stream_failure_rate: 最初のチャンクの後に通信が途切れる確率
+    rpm: 1分あたりのリクエスト数の上限（超えると429。None は無制限）
+    """
+
+    def __init__(self, latency: float = 0.5, latency_sigma: float = 0.3, chunk_interval: float = 0.05,
+                 chunks: int = 8, quota_error_rate: float = 0.0, failure_rate: float = 0.0,
+                 stream_failure_rate: float = 0.0, rpm: Optional[int] = None):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.chunk_interval = chunk_interval
+        self.chunks = chunks
+        self.quota_error_rate = quota_error_rate
+        self.failure_rate = failure_rate
+        self.stream_failure_rate = stream_failure_rate
+        self.rpm = rpm
+
+    def sample_latency(self, rng: random.Random) -> float:
+        if self.latency_sigma <= 0:
+            return self.latency
+        return rng.lognormvariate(math.log(self.latency), self.latency_sigma)
+
+
+# 実際のモデルのおおよその傾向（Flash-Lite が最も速い）に合わせた既定値
+DEFAULT_PROFILES = {
+    'gemini-2.5-flash-lite': FakeModelProfile(latency=0.4, chunk_interval=0.03),
+    'gemini-2.5-flash': FakeModelProfile(latency=0.8, chunk_interval=0.05),
+    'gemini-1.5-flash': FakeModelProfile(latency=0.6, chunk_interval=0.04),
+}
+
+# 例: FAKE_GEMINI_PROFILES='{"gemini-2.5-flash-lite": {"latency": 1.0, "quota_error_rate": 0.2}}'
+_profiles: Dict[str, FakeModelProfile] = dict(DEFAULT_PROFILES)
+if os.environ.get('FAKE_GEMINI_PROFILES'):
+    for _name, _options in json.loads(os.environ['FAKE_GEMINI_PROFILES']).items():
+        _profiles[_name] = FakeModelProfile(**_options)
+
+_REPLIES = [
+    "お話ししてくれてありがとうございます。",
+    "それはとても大変でしたね。",
+    "そう感じるのは自然なことだと思います。",
+    "よかったら、もう少し詳しく聞かせてもらえますか？",
+    "一人で抱え込まずに話してくれて、本当によかったです。",
+    "今日はゆっくり休めそうですか？",
+]
+_SUMMARY = "## 相談内容\n- 最近の悩みについて話しました\n## 今後に向けて\n- 無理をせず休むことを大切にする"
+
+
+def configure(profiles: Optional[Dict[str, FakeModelProfile]] = None, **defaults: Any) -> None:
+    """モデルごとの設定を差し替える（defaults は全モデル共通で上書きする項目）"""
+    if profiles is not None:
+        _profiles.clear()
+        _profiles.update(profiles)
+    for profile in _profiles.values():
+        for key, value in defaults.items():
+            setattr(profile, key, value)
+
+
+class _FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _RateWindow:
+    """直近1分間のリクエスト時刻"""
+
+    def __init__(self):
+        self.requests: Deque[float] = deque()
+        self.lock = threading.Lock()
+
+    def admit(self, rpm: Optional[int]) -> bool:
+        if rpm is None:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            while self.requests and now - self.requests[0] >= 60:
+                self.requests.popleft()
+            if len(self.requests) >= rpm:
+                return False
+            self.requests.append(now)
+            return True
+
+
+class FakeGenerativeModel:
+    """genai.GenerativeModel の generate_content だけを真似たモデル"""
+
+    def __init__(self, model_name: str, window: _RateWindow, rng: random.Random):
+        self.model_name = model_name
+        self._window = window
+        self._rng = rng
+
+    @property
+    def profile(self) -> FakeModelProfile:
+        return _profiles.get(self.model_name) or FakeModelProfile()
+
+    def _reply(self, prompt: str, chunks: int) -> List[str]:
+        if "【まとめる内容】" in prompt:
+            text = _SUMMARY
+            return [text[len(text) * i // chunks:len(text) * (i + 1) // chunks] for i in range(chunks)]
+        return [self._rng.choice(_REPLIES) for _ in range(chunks)]
+
+    def generate_content(self, prompt: str, safety_settings: Any = None, generation_config: Any = None,
+                         stream: bool = False) -> Any:
+        profile = self.profile
+        if not self._window.admit(profile.rpm):
+            raise FakeQuotaError(f"429 Resource has been exhausted (e.g. check quota). {self.model_name} retry in 60s")
+        roll = self._rng.random()
+        if roll < profile.quota_error_rate:
+            time.sleep(profile.sample_latency(self._rng) / 4)
+            raise FakeQuotaError(f"429 Resource has been exhausted (e.g. check quota). {self.model_name}")
+        if roll < profile.quota_error_rate + profile.failure_rate:
+            time.sleep(profile.sample_latency(self._rng) / 2)
+            raise FakeServiceError(f"503 The model {self.model_name} is overloaded")
+
+        latency = profile.sample_latency(self._rng)
+        parts = self._reply(prompt, profile.chunks)
+        if not stream:
+            time.sleep(latency + profile.chunk_interval * (len(parts) - 1))
+            return _FakeChunk("".join(parts))
+        return self._stream(parts, latency, profile)
+
+    def _stream(self, parts: List[str], latency: float, profile: FakeModelProfile) -> Iterator[_FakeChunk]:
+        time.sleep(latency)
+        fail_at = len(parts)
+        if self._rng.random() < profile.stream_failure_rate:
+            fail_at = self._rng.randint(1, max(1, len(parts) - 1))
+        for i, part in enumerate(parts):
+            if i:
+                time.sleep(profile.chunk_interval)
+            if i >= fail_at:
+                raise FakeServiceError("503 connection reset during streaming")
+            yield _FakeChunk(part)
+
+
+@lru_cache(maxsize=None)
+def _rate_window(api_key: str, model_name: str) -> _RateWindow:
+    return _RateWindow()
+
+
+def fake_model_factory(api_key: str, purpose: str = 'response',
+                       seed: Optional[int] = None) -> Callable[[str], FakeGenerativeModel]:
+    """gemini_model_factory と同じ形のファクトリ（RPMの枠はAPIキー・モデルごとに共有。purpose は使わない）"""
+    rng = random.Random(seed)
+
+    def factory(model_name: str) -> FakeGenerativeModel:
+        return FakeGenerativeModel(model_name, _rate_window(api_key, model_name), rng)
+    return factory
@@ -0,0 +1,346 @@
+"""サーキットブレーカー・リトライ・ヘッジ付きのモデルフォールバック"""
+import random
+import re
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+import metrics
+from quota import QuotaExceededError, QuotaScheduler
+
+T = TypeVar('T')
+
+# エラーの種類
+QUOTA = 'quota'          # 429 / 利用枠超過 - 待てば回復する
+TRANSIENT = 'transient'  # 5xx / タイムアウト / 通信エラー - 再試行で回復しうる
+FATAL = 'fatal'          # APIキー不正・リクエスト不正など - 再試行しても回復しない
+
+_TRANSIENT_CODES = {500, 502, 503, 504}
+# google.api_core.exceptions などの例外クラス名
+_QUOTA_NAMES = ('ResourceExhausted', 'TooManyRequests')
+_TRANSIENT_NAMES = ('ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError',
+                    'Timeout', 'ConnectionError')
+# code 属性を持たない例外に包まれた場合の、SDK のメッセージ形式（"{HTTPステータス} {メッセージ}"）
+_STATUS_PREFIX = re.compile(r'^(\d{3}) ')
+# SDK（google.api_core）の429のメッセージに含まれる違反した枠のID（例: GenerateRequestsPerDayPerProjectPerModel-FreeTier）
+_QUOTA_ID_PATTERN = re.compile(r'quota_id:\s*"([\w-]+)"')
+_RETRY_PATTERNS = [
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)'),
+    re.compile(r'retry in ([\d.]+)\s*s', re.IGNORECASE),
+]
+
+
+def error_status(error: Optional[Exception]) -> Optional[int]:
+    """エラーのHTTPステータス（code 属性、なければSDKのメッセージ先頭のステータス）"""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code
+    if error is None:
+        return None
+    match = _STATUS_PREFIX.match(str(error))
+    return int(match.group(1)) if match else None
+
+
+def is_quota_error(error: Optional[Exception]) -> bool:
+    """レート制限（429 / quota）によるエラーか"""
+    if isinstance(error, QuotaExceededError):
+        return True
+    return type(error).__name__ in _QUOTA_NAMES or error_status(error) == 429
+
+
+def quota_ids(error: Optional[Exception]) -> List[str]:
+    """429のエラーが示す、上限に達した枠のID"""
+    ids = []
+    for detail in getattr(error, 'details', None) or ():
+        for violation in getattr(detail, 'violations', ()):
+            quota_id = getattr(violation, 'quota_id', '')
+            if quota_id:
+                ids.append(quota_id)
+    return ids or _QUOTA_ID_PATTERN.findall(str(error))
+
+
+def is_daily_quota_error(error: Optional[Exception]) -> bool:
+    """1日あたりのリクエスト数の上限（RPD）による429か"""
+    return is_quota_error(error) and any('PerDay' in quota_id for quota_id in quota_ids(error))
+
+
+def classify_error(error: Exception) -> str:
+    """エラーを QUOTA / TRANSIENT / FATAL に分類する（ステータスと例外の型のみで判定する）"""
+    if is_quota_error(error):
+        return QUOTA
+    if error_status(error) in _TRANSIENT_CODES:
+        return TRANSIENT
+    if isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__.endswith(_TRANSIENT_NAMES):
+        return TRANSIENT
+    return FATAL
+
+
+def retry_after_hint(error: Exception) -> Optional[float]:
+    """エラーに含まれる再試行までの待ち時間（秒）を取り出す"""
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after is not None:
+        return float(retry_after)
+    error_msg = str(error)
+    for pattern in _RETRY_PATTERNS:
+        match = pattern.search(error_msg)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class AllModelsFailedError(Exception):
+    """すべての候補モデルで失敗した（last_error に最後のエラー）"""
+
+    def __init__(self, last_error: Optional[Exception]):
+        super().__init__(str(last_error))
+        self.last_error = last_error
+
+
+class CircuitBreaker:
+    """失敗が続いた・枠を使い切ったモデルを一定時間使わないようにする
+
+    遮断（open）→ クールダウン後は半開（half-open）になり、試行を1件だけ通す。その結果が成功なら閉じ、
+    失敗なら再び遮断する。試行の結果が cooldown 秒たっても届かない場合（送信されなかった場合など）は次の1件を通す。
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.last_error: Optional[Exception] = None
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """現在このモデルに送信してよいか（クールダウン後は試行を1件だけ許可する）"""
+        with self._lock:
+            if not self.open_until:
+                return True
+            now = time.monotonic()
+            if now < self.open_until:
+                return False
+            if self._probe_started is not None and now - self._probe_started < self.cooldown:
+                # 半開中で、先に許可した試行の結果を待っている
+                return False
+            self._probe_started = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.open_until = 0.0
+            self._probe_started = None
+
+    def record_failure(self, error: Exception) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self.last_error = error
+            self._probe_started = None
+            if classify_error(error) == QUOTA:
+                # 枠切れは1回で遮断し、APIが示す待ち時間を優先する
+                retry_after = retry_after_hint(error)
+                self.open_until = now + (retry_after if retry_after is not None else self.cooldown)
+                return
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                # 半開中の試行の失敗も、閾値を超えているため再び遮断する
+                self.open_until = now + self.cooldown
+
+
+class LatencyTracker:
+    """モデルごとの直近の応答時間からヘッジ送信までの待ち時間を決める"""
+
+    def __init__(self, percentile: float = 0.9, window: int = 100, min_samples: int = 5,
+                 default_delay: float = 4.0, min_delay: float = 1.0):
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name: str, elapsed: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model_name, deque(maxlen=self.window)).append(elapsed)
+
+    def hedge_delay(self, model_name: str) -> float:
+        with self._lock:
+            samples = sorted(self._samples.get(model_name, ()))
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(len(samples) - 1, int(len(samples) * self.percentile))
+        return max(self.min_delay, samples[index])
+
+
+class FallbackEngine:
+    """複数モデルへのリクエストを、遮断・再試行・ヘッジを行いながら実行する
+
+    プロセス内で共有し、ブレーカーや応答時間の統計を全セッションで使い回す前提。
+    """
+
+    def __init__(self, scheduler: Optional[QuotaScheduler] = None, hedge: bool = True,
+                 max_rounds: int = 2, backoff_base: float = 0.5, backoff_cap: float = 4.0,
+                 failure_threshold: int = 3, cooldown: float = 30.0,
+                 latency: Optional[LatencyTracker] = None, max_workers: int = 8):
+        self.scheduler = scheduler
+        self.hedge = hedge
+        self.max_rounds = max_rounds
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latency = latency or LatencyTracker()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm')
+        # キャッシュから外れた実行器が使われなくなったら、ワーカースレッドも終了させる
+        self._finalizer = weakref.finalize(self, self._executor.shutdown, wait=False)
+
+    def shutdown(self) -> None:
+        """ワーカースレッドを終了させる（実行中の試行は最後まで実行される）"""
+        self._finalizer()
+
+    def breaker(self, model_name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model_name)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.cooldown)
+                self._breakers[model_name] = breaker
+            return breaker
+
+    def run(self, model_names: Sequence[str], tokens: int, attempt: Callable[[str], T],
+            discard: Optional[Callable[[T], None]] = None) -> Tuple[str, T]:
+        """attempt(モデル名) を成功するまで実行し、(モデル名, 結果) を返す
+
+        ヘッジ送信で採用されなかった試行の結果は discard に渡して手放す（開いたストリームを閉じるなど）。
+        すべて失敗した場合は AllModelsFailedError を送出する。
+        """
+        last_error: Optional[Exception] = None
+        for round_index in range(self.max_rounds):
+            candidates = [name for name in model_names if self.breaker(name).allow()]
+            if not candidates:
+                # すべて遮断中の場合は遮断のきっかけになったエラーを返す
+                last_error = last_error or next(
+                    (self.breaker(name).last_error for name in model_names if self.breaker(name).last_error), None)
+                break
+            try:
+                return self._run_round(candidates, tokens, attempt, discard)
+            except AllModelsFailedError as e:
+                last_error = e.last_error
+            except QuotaExceededError as e:
+                last_error = e
+                break
+
+            if round_index + 1 >= self.max_rounds or classify_error(last_error) == FATAL:
+                break
+            delay = self._backoff(round_index, retry_after_hint(last_error))
+            if delay is None:
+                break
+            time.sleep(delay)
+
+        raise AllModelsFailedError(last_error)
+
+    def _backoff(self, round_index: int, retry_after: Optional[float]) -> Optional[float]:
+        """ジッター付き指数バックオフ（APIの待ち時間が上限を超える場合は再試行しない）"""
+        if retry_after is not None:
+            if retry_after > self.backoff_cap:
+                return None
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** round_index))
+
+    def _attempt(self, model_name: str, attempt: Callable[[str], T]) -> T:
+        metrics.incr('model_attempts', model=model_name)
+        with metrics.span('attempt', model=model_name):
+            started = time.perf_counter()
+            result = attempt(model_name)
+            self.latency.record(model_name, time.perf_counter() - started)
+        return result
+
+    def _run_round(self, candidates: List[str], tokens: int, attempt: Callable[[str], T],
+                   discard: Optional[Callable[[T], None]]) -> Tuple[str, T]:
+        """候補を順に試す。応答が遅い場合は次の候補を並行して送り、先に成功した方を採用"""
+        remaining = list(candidates)
+        pending: Dict[Future, str] = {}
+        last_error: Optional[Exception] = None
+
+        def launch(required: bool) -> Optional[str]:
+            if self.scheduler is None:
+                model_name = remaining[0]
+            else:
+                # ヘッジ送信は枠が空いていなければ待たずに見送る
+                model_name = self.scheduler.acquire(remaining, tokens, max_wait=None if required else 0)
+                if model_name is None:
+                    if required:
+                        raise QuotaExceededError("quota: 利用可能なモデルの枠が空くまで待機しましたが、空きませんでした")
+                    return None
+            remaining.remove(model_name)
+            if model_name != candidates[0]:
+                # 先頭の候補以外への送信（失敗後の切り替え・ヘッジ）
+                metrics.incr('model_fallbacks' if required else 'model_hedges', model=model_name)
+            pending[self._executor.submit(self._attempt, model_name, attempt)] = model_name
+            return model_name
+
+        last_launched = launch(required=True)
+        while pending:
+            timeout = None
+            if self.hedge and remaining and len(pending) == 1:
+                timeout = self.latency.hedge_delay(last_launched)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                last_launched = launch(required=False) or last_launched
+                if len(pending) == 1:
+                    # ヘッジできなかった場合は完了まで待つ
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                else:
+                    continue
+
+            for future in done:
+                model_name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    self._record_failure(model_name, e)
+                    continue
+                self.breaker(model_name).record_success()
+                metrics.incr('model_successes', model=model_name)
+                self._abandon(pending, discard)
+                return model_name, result
+
+            if not pending and remaining:
+                last_launched = launch(required=True)
+
+        raise AllModelsFailedError(last_error)
+
+    def _abandon(self, pending: Dict[Future, str], discard: Optional[Callable[[T], None]]) -> None:
+        """採用しなかった試行を取り消す。実行中のものは完了時に結果を記録し、成功していれば discard で手放す"""
+        for future, model_name in pending.items():
+            if future.cancel():
+                continue
+            future.add_done_callback(lambda done, name=model_name: self._settle(name, done, discard))
+
+    def _settle(self, model_name: str, future: Future, discard: Optional[Callable[[T], None]]) -> None:
+        error = future.exception()
+        if error is not None:
+            self._record_failure(model_name, error)
+            return
+        self.breaker(model_name).record_success()
+        metrics.incr('model_hedge_discards', model=model_name)
+        if discard is not None:
+            try:
+                discard(future.result())
+            except Exception:
+                pass
+
+    def _record_failure(self, model_name: str, error: Exception) -> None:
+        self.breaker(model_name).record_failure(error)
+        error_class = classify_error(error)
+        metrics.incr('model_failures', model=model_name, error=error_class)
+        if self.scheduler is not None and error_class == QUOTA:
+            # 429が返ったモデルは他のセッションからも当面（1日の上限なら次のリセットまで）使わないようにする
+            self.scheduler.mark_exhausted(model_name, daily=is_daily_quota_error(error))
@@ -0,0 +1,394 @@
+"""Gemini APIによる応答・まとめ生成"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import metrics
+from fake_gemini import fake_model_factory
+from fallback import AllModelsFailedError, FallbackEngine, is_quota_error
+from context import ContextBuilder
+from prompts import generate_system_prompt
+from quota import estimate_tokens
+from summary import SummaryCache
+
+# 2025年1月時点で無料枠で使用できる最新モデル
+# gemini-2.5-flash: 10 RPM, 250K TPM, 250 RPD (バランス型)
+# gemini-2.5-flash-lite: 15 RPM, 250K TPM, 1000 RPD (高スループット)
+MODELS_TO_TRY = [
+    'gemini-2.5-flash-lite',  # 最高スループット、1日1000リクエスト
+    'gemini-2.5-flash',       # バランス型、1日250リクエスト
+    'gemini-1.5-flash'        # フォールバック用の安定版
+]
+
+SUMMARY_MODEL = 'gemini-2.5-flash-lite'
+
+# 安全設定を追加（不適切なコンテンツのブロック）
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_NONE"
+    }
+]
+
+RESPONSE_GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "max_output_tokens": 500,  # 応答を簡潔に保つ
+}
+
+SUMMARY_GENERATION_CONFIG = {
+    "temperature": 0.5,
+    "max_output_tokens": 800,
+}
+
+QUOTA_ERROR_MESSAGE = """
+申し訳ございません。現在、APIの利用制限に達しています。
+
+**解決方法:**
+- 数分待ってから再度お試しください
+- 1日の制限に達した場合は、翌日00:00（太平洋時間）にリセットされます
+
+**無料枠の制限:**
+- 1分間に10-15リクエスト (RPM)
+- 1日に250-1,000リクエスト (RPD)
+  - Gemini 2.5 Flash: 250リクエスト/日
+  - Gemini 2.5 Flash-Lite: 1,000リクエスト/日
+- 1分間に250,000トークン (TPM)
+
+**今すぐ相談したい場合:**
+- 学校のカウンセラー
+- 保健室の先生
+- いのちの電話: 0120-783-556（24時間対応）
+"""
+
+# モデル名を受け取り generate_content を持つオブジェクトを返す関数
+# （テストではローカルの偽モデルを返す関数に差し替えられる）。
+# 安全設定・生成設定は用途（'response' / 'summary'）ごとにモデルの生成時に持たせ、送信ごとには渡さない
+ModelFactory = Callable[[str], Any]
+
+# 使用するモデルの実装（CHAT_LLM_BACKEND=fake でネットワークを使わない代役になる）
+LLM_BACKEND = os.environ.get('CHAT_LLM_BACKEND', 'gemini')
+
+# 用途ごとにモデルへ持たせる設定
+MODEL_SETTINGS = {
+    'response': {'safety_settings': SAFETY_SETTINGS, 'generation_config': RESPONSE_GENERATION_CONFIG},
+    'summary': {'generation_config': SUMMARY_GENERATION_CONFIG},
+}
+
+# モデルを保持しておくAPIキーの数（超えると最も古く登録されたキーの分から破棄する）
+MAX_API_KEYS = 32
+
+
+def load_sdk() -> Any:
+    """Gemini SDK を読み込む
+
+    インポートに時間がかかる（数百ms）ため、起動時には読み込まず、最初にモデルを生成するとき
+    （またはアプリの初回描画後の事前読み込み）まで遅らせる。2回目以降は読み込み済みのものを返す。
+    """
+    import google.generativeai as genai
+    return genai
+
+
+def use_client(model: Any, client: Any) -> None:
+    """モデルの送信先をAPIキーごとのクライアントに差し替える
+
+    genai.configure のグローバル設定はセッション間で競合するが、google-generativeai には
+    モデルごとにクライアントを渡す公開APIがないため、GenerativeModel の _client 属性
+    （未設定なら None で、最初の送信時に既定のクライアントが入る）を使う。
+    SDKの構造が変わって属性がない場合は、別のキーで送信しないように例外にする。
+    """
+    if '_client' not in vars(model):
+        raise RuntimeError(f"この google-generativeai（{getattr(load_sdk(), '__version__', '?')}）では"
+                           "APIキーごとのクライアントを設定できません")
+    model._client = client
+
+
+class ModelRegistry:
+    """APIキー・モデル・用途ごとに生成済みのモデルを保持し、全セッション・再実行で使い回す
+
+    クライアントとモデル（設定の変換を含む）の生成は初回だけで、以降の取得は辞書の参照のみ。
+    """
+
+    def __init__(self, max_api_keys: int = MAX_API_KEYS):
+        self.max_api_keys = max_api_keys
+        self._clients: "OrderedDict[str, Any]" = OrderedDict()
+        self._models: Dict[Tuple[str, str, str], Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str, model_name: str, purpose: str = 'response') -> Any:
+        key = (api_key, model_name, purpose)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                genai = load_sdk()
+                model = genai.GenerativeModel(model_name, **MODEL_SETTINGS[purpose])
+                use_client(model, self._client(api_key))
+                self._models[key] = model
+            return model
+
+    def _client(self, api_key: str) -> Any:
+        client = self._clients.get(api_key)
+        if client is None:
+            from google.ai import generativelanguage as glm
+            client = self._clients[api_key] = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+            while len(self._clients) > self.max_api_keys:
+                self._evict(next(iter(self._clients)))
+        else:
+            self._clients.move_to_end(api_key)
+        return client
+
+    def evict(self, api_key: str) -> None:
+        """APIキーが変更・破棄されたときに、そのキーのクライアントとモデルを手放す"""
+        with self._lock:
+            self._evict(api_key)
+
+    def _evict(self, api_key: str) -> None:
+        self._clients.pop(api_key, None)
+        for key in [key for key in self._models if key[0] == api_key]:
+            del self._models[key]
+
+
+MODEL_REGISTRY = ModelRegistry()
+
+
+def gemini_model_factory(api_key: str, purpose: str = 'response') -> ModelFactory:
+    """Gemini SDKのモデルを返すファクトリ（APIキー・モデル・用途ごとに生成済みのものを再利用）"""
+    def factory(model_name: str) -> Any:
+        return MODEL_REGISTRY.get(api_key, model_name, purpose)
+    return factory
+
+
+LLM_BACKENDS: Dict[str, Callable[..., ModelFactory]] = {
+    'gemini': gemini_model_factory,
+    'fake': fake_model_factory,
+}
+
+
+def get_model_factory(api_key: str, purpose: str = 'response', backend: Optional[str] = None) -> ModelFactory:
+    """設定されたバックエンドのモデルファクトリ"""
+    return LLM_BACKENDS[backend or LLM_BACKEND](api_key, purpose)
+
+
+def build_response_prompt(user_message: str, risk_level: int, needs_type: str, chat_history: List[Dict],
+                          context: Optional[ContextBuilder] = None, model_name: Optional[str] = None) -> str:
+    """応答生成用のプロンプトを組み立てる（会話履歴はモデルごとのトークン予算に収める）"""
+    with metrics.span('system_prompt'):
+        system_prompt = generate_system_prompt(risk_level, needs_type)
+    if context is None:
+        context = ContextBuilder()
+
+    # 履歴の末尾が現在の相談そのものであれば、【現在の相談】と重複するため除く
+    history = chat_history
+    if history and history[-1]['role'] == 'user' and history[-1]['content'] == user_message:
+        history = history[:-1]
+
+    budget = context.budget_for(model_name or MODELS_TO_TRY[0]) - estimate_tokens(user_message)
+    with metrics.span('build_prompt'):
+        prefix = context.build_prefix(system_prompt, history, budget)
+    return f"{prefix}\n\n【現在の相談】\n相談者: {user_message}\n\nAI:"
+
+
+def format_generation_error(error: Optional[Exception]) -> str:
+    """すべてのモデルで失敗した場合に表示するメッセージ"""
+    error_msg = str(error)
+    if is_quota_error(error):
+        return QUOTA_ERROR_MESSAGE
+    return f"エラーが発生しました。しばらくしてから再度お試しください。\n\nエラー詳細: {error_msg[:150]}"
+
+
+def _chunk_text(chunk: Any) -> str:
+    """ストリームの1チャンクからテキストを取り出す（安全フィルタ等で空の場合は空文字）"""
+    try:
+        return chunk.text or ""
+    except ValueError:
+        return ""
+
+
+def _close_stream(opened: Tuple[str, Iterator[Any]]) -> None:
+    """ヘッジ送信で採用されなかったストリームを閉じる"""
+    close = getattr(opened[1], 'close', None)
+    if close is not None:
+        close()
+
+
+class ResponseStream:
+    """モデルの応答をチャンク単位で返すイテレータ
+
+    最初のチャンクが届く前に失敗した場合は次のモデルにフォールバックする。
+    反復が終わると text に全文、model_name に応答したモデル、
+    time_to_first_token / total_time に計測値（秒）が入る。
+    """
+
+    def __init__(self, prompt: Union[str, Callable[[str], str]], model_factory: ModelFactory,
+                 models: Optional[List[str]] = None, engine: Optional[FallbackEngine] = None):
+        # prompt はモデル名を受け取ってプロンプトを返す関数でもよい（モデルごとの予算に合わせる場合）
+        self._prompt = prompt if callable(prompt) else (lambda model_name: prompt)
+        self._prompt_lock = threading.Lock()
+        self.model_factory = model_factory
+        self.models = list(models or MODELS_TO_TRY)
+        self.engine = engine or FallbackEngine()
+        self.text = ""
+        self.model_name: Optional[str] = None
+        self.time_to_first_token: Optional[float] = None
+        self.total_time: Optional[float] = None
+        self.last_error: Optional[Exception] = None
+
+    def build_prompt(self, model_name: str) -> str:
+        # ヘッジ送信時は別スレッドからも呼ばれるため、履歴の組み立てを直列化する
+        with self._prompt_lock:
+            return self._prompt(model_name)
+
+    def _open(self, model_name: str) -> Tuple[str, Iterator[Any]]:
+        """ストリームを開き、最初の空でないチャンクまで読む"""
+        model = self.model_factory(model_name)
+        response = model.generate_content(self.build_prompt(model_name), stream=True)
+        chunks = iter(response)
+        for chunk in chunks:
+            first = _chunk_text(chunk)
+            if first:
+                return first, chunks
+        raise ValueError(f"{model_name}: 空の応答が返されました")
+
+    def __iter__(self) -> Iterator[str]:
+        started = time.perf_counter()
+        tokens = estimate_tokens(self.build_prompt(self.models[0])) + RESPONSE_GENERATION_CONFIG["max_output_tokens"]
+        try:
+            try:
+                self.model_name, (first, chunks) = self.engine.run(self.models, tokens, self._open, discard=_close_stream)
+            except AllModelsFailedError as e:
+                # すべてのモデルで失敗した場合
+                self.last_error = e.last_error
+                yield from self._emit(format_generation_error(self.last_error))
+                return
+
+            self.time_to_first_token = time.perf_counter() - started
+            metrics.observe('time_to_first_token', self.time_to_first_token, model=self.model_name)
+            yield from self._emit(first)
+            try:
+                for chunk in chunks:
+                    text = _chunk_text(chunk)
+                    if text:
+                        yield from self._emit(text)
+            except Exception as e:
+                # 途中まで表示済みのため、別モデルでやり直さずに打ち切る
+                self.last_error = e
+                yield from self._emit("\n\n（通信が途切れたため、応答が途中で終了しました）")
+        finally:
+            self.total_time = time.perf_counter() - started
+            metrics.observe('response', self.total_time, model=self.model_name or 'none')
+
+    def _emit(self, text: str) -> Iterator[str]:
+        self.text += text
+        yield text
+
+
+def stream_ai_response_gemini(user_message: str, risk_level: int, needs_type: str, chat_history: List[Dict], api_key: str,
+                              model_factory: Optional[ModelFactory] = None,
+                              engine: Optional[FallbackEngine] = None,
+                              context: Optional[ContextBuilder] = None) -> ResponseStream:
+    """Gemini APIの応答をストリーミングで生成"""
+    if model_factory is None:
+        model_factory = get_model_factory(api_key)
+    if context is None:
+        context = ContextBuilder()
+
+    def prompt(model_name: str) -> str:
+        return build_response_prompt(user_message, risk_level, needs_type, chat_history, context, model_name)
+
+    return ResponseStream(prompt, model_factory, engine=engine)
+
+
+def generate_ai_response_gemini(user_message: str, risk_level: int, needs_type: str, chat_history: List[Dict], api_key: str,
+                                model_factory: Optional[ModelFactory] = None,
+                                engine: Optional[FallbackEngine] = None,
+                                context: Optional[ContextBuilder] = None) -> str:
+    """Gemini APIを使用してAI応答を生成"""
+    try:
+        if model_factory is None:
+            model_factory = get_model_factory(api_key)
+        if engine is None:
+            engine = FallbackEngine()
+        if context is None:
+            context = ContextBuilder()
+
+        prompt_lock = threading.Lock()
+
+        def build_prompt(model_name: str) -> str:
+            with prompt_lock:
+                return build_response_prompt(user_message, risk_level, needs_type, chat_history, context, model_name)
+
+        tokens = estimate_tokens(build_prompt(MODELS_TO_TRY[0])) + RESPONSE_GENERATION_CONFIG["max_output_tokens"]
+
+        def attempt(model_name: str) -> str:
+            model = model_factory(model_name)
+            response = model.generate_content(build_prompt(model_name))
+            return response.text
+
+        try:
+            _, text = engine.run(MODELS_TO_TRY, tokens, attempt)
+            return text
+        except AllModelsFailedError as e:
+            # すべてのモデルで失敗した場合
+            return format_generation_error(e.last_error)
+
+    except Exception as e:
+        return f"予期しないエラーが発生しました: {str(e)[:150]}\n\nAPIキーが正しいか確認してください。"
+
+
+def generate_conversation_summary(chat_history: List[Dict], api_key: str,
+                                  model_factory: Optional[ModelFactory] = None,
+                                  engine: Optional[FallbackEngine] = None,
+                                  cache: Optional[SummaryCache] = None) -> str:
+    """会話全体のまとめを生成
+
+    cache を渡すと前回のまとめとその後の会話だけを送って更新し、
+    新しいメッセージがなければAPIを呼ばずに前回のまとめを返す。
+    """
+    try:
+        # 呼び出し時点の履歴に固定する（MessageStore ではコピーせずビューになる）
+        history = chat_history[:]
+        if cache is None:
+            cache = SummaryCache()
+        cached = cache.lookup(history)
+        if cached is not None:
+            return cached
+
+        if model_factory is None:
+            model_factory = get_model_factory(api_key, 'summary')
+        if engine is None:
+            engine = FallbackEngine()
+
+        summary_prompt = cache.build_prompt(history)
+
+        def attempt(model_name: str) -> str:
+            model = model_factory(model_name)
+            response = model.generate_content(summary_prompt)
+            return response.text
+
+        tokens = estimate_tokens(summary_prompt) + SUMMARY_GENERATION_CONFIG["max_output_tokens"]
+        try:
+            _, summary = engine.run([SUMMARY_MODEL], tokens, attempt)
+        except AllModelsFailedError as e:
+            raise e.last_error or e
+        cache.store(history, summary)
+        return summary
+
+    except Exception as e:
+        return f"まとめの生成中にエラーが発生しました: {str(e)[:150]}"
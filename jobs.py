@@ -0,0 +1,73 @@
+"""応答・まとめの生成をスクリプト実行スレッドの外で行うワーカープール"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# 同時に実行できる生成処理の数。応答の生成はストリームを読み終えるまでワーカーを1つ占有するため、
+# 同時に応答を待つセッション数の上限になる（超えた分は空きが出るまで待つ）
+MAX_WORKERS = int(os.environ.get('CHAT_JOB_WORKERS', '16'))
+
+
+class Job:
+    """バックグラウンドで実行中・実行済みの生成処理
+
+    progress には途中経過を持つオブジェクト（ResponseStream など）を入れておき、
+    画面側はそれを定期的に読んで部分的な結果を表示する。
+    """
+
+    def __init__(self, kind: str, progress: Any = None, **meta: Any):
+        self.kind = kind
+        self.progress = progress
+        self.meta = meta
+        self.status = RUNNING
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _run(self, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        try:
+            self.result = fn(*args, **kwargs)
+            self.status = DONE
+        except Exception as e:
+            self.error = e
+            self.status = FAILED
+        finally:
+            self.finished = time.perf_counter()
+            self._done.set()
+
+
+class JobPool:
+    """プロセス全体で共有するワーカープール"""
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+    def submit(self, job: Job, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Job:
+        self._executor.submit(job._run, fn, args, kwargs)
+        return job
+
+    def submit_once(self, jobs: Dict[str, Job], job: Job, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Job:
+        """同じ種類の処理が実行中ならそれを返し（連打をまとめる）、なければ新しく投入する
+
+        jobs はセッションごとの {種類: Job} の辞書。
+        """
+        running = jobs.get(job.kind)
+        if running is not None and not running.done:
+            return running
+        jobs[job.kind] = job
+        return self.submit(job, fn, *args, **kwargs)
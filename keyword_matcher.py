@@ -0,0 +1,102 @@
+"""複数キーワードを1回の走査で検出するための Aho-Corasick オートマトン
+
+キーワードが少ないうちは、キーワードごとに str.find（C実装）で探す方が Python で書いた
+オートマトンの1文字ずつの走査より速いため、AUTOMATON_MIN_KEYWORDS 件未満ではそちらを使う。
+"""
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# オートマトンでの走査に切り替えるキーワード数。1件あたりの照合時間は、str.find はキーワード数に比例し、
+# オートマトンはほぼ一定（短文で約100µs）のため、約150件で逆転する（現在の辞書は約60件）
+AUTOMATON_MIN_KEYWORDS = 150
+
+
+class KeywordMatcher:
+    """キーワード集合から構築する多パターン照合器
+
+    キーワードが AUTOMATON_MIN_KEYWORDS 件以上ならオートマトンを構築し、照合はテキスト長に比例した時間で終わる
+    （キーワード数を増やしても1回の走査は遅くならない）。それ未満ではキーワードごとに str.find で探す。
+    どちらでも結果（出現順・重なりを含む）は同じ。
+    """
+
+    def __init__(self, keywords: Iterable[str], use_automaton: Optional[bool] = None):
+        # 重複を除きつつ登録順を保持する
+        self.keywords: List[str] = list(dict.fromkeys(k for k in keywords if k))
+        self._lengths: List[int] = [len(k) for k in self.keywords]
+        if use_automaton is None:
+            use_automaton = len(self.keywords) >= AUTOMATON_MIN_KEYWORDS
+        self.use_automaton = use_automaton
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        if use_automaton:
+            self._build()
+
+    def _build(self) -> None:
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for ch in keyword:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] = self._output[state] + (keyword_id,)
+
+        # 幅優先で失敗遷移を張り、接尾辞側の出力を合流させる
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """(開始位置, キーワードID) を出現順に返す（重なりも含む）"""
+        if not self.use_automaton:
+            return iter(self._find_matches(text))
+        return self._scan(text)
+
+    def _find_matches(self, text: str) -> List[Tuple[int, int]]:
+        """キーワードごとに str.find で探し、オートマトンと同じ順（終了位置順、同じ位置では長い方が先）に並べる"""
+        found = []
+        for keyword_id, keyword in enumerate(self.keywords):
+            start = text.find(keyword)
+            while start != -1:
+                found.append((start + self._lengths[keyword_id], -self._lengths[keyword_id], start, keyword_id))
+                start = text.find(keyword, start + 1)
+        if len(found) > 1:
+            found.sort()
+        return [(start, keyword_id) for _, _, start, keyword_id in found]
+
+    def _scan(self, text: str) -> Iterator[Tuple[int, int]]:
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        lengths = self._lengths
+        state = 0
+        for end, ch in enumerate(text, 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for keyword_id in output[state]:
+                yield end - lengths[keyword_id], keyword_id
+
+    def find_all(self, text: str) -> List[Tuple[int, str]]:
+        """(開始位置, キーワード) のリストを返す"""
+        return [(start, self.keywords[keyword_id]) for start, keyword_id in self.iter_matches(text)]
+
+    def matched_ids(self, text: str) -> set:
+        """テキスト中に1回以上出現したキーワードIDの集合"""
+        return {keyword_id for _, keyword_id in self.iter_matches(text)}
@@ -0,0 +1,238 @@
+"""セッションごとの会話履歴をコンパクトに保持するストア
+
+メッセージは __slots__ のレコード（時刻は整数、検出キーワードは共有の表のID）で持ち、
+メモリ上に置く件数が上限を超えると古いものから一時ファイルへ退避する。
+読み出し側（描画・プロンプト組み立て・保存）からは、これまでどおり dict のリストとして見える。
+"""
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# メモリ上に置くメッセージ数の上限（超えた分は古いものから一時ファイルへ退避する）
+MAX_MESSAGES_IN_MEMORY = int(os.environ.get('CHAT_MAX_MESSAGES_IN_MEMORY', '200'))
+# 退避は上限を超えるたびに1件ずつではなく、この割合をまとめて行う
+SPILL_FRACTION = 0.25
+
+# レコードが直接持つキー（表示順もこの順）
+FIELDS = ('role', 'content', 'timestamp', 'risk_level', 'needs_type', 'detected_keywords', 'crisis_card',
+          'model', 'time_to_first_token', 'response_time')
+# 取りうる値が少ない文字列は intern して全メッセージで同じオブジェクトを共有する
+_INTERNED = ('role', 'needs_type', 'crisis_card', 'model')
+# FIELDS の各キーを保持するスロット名
+_SLOTS = tuple({'timestamp': '_timestamp', 'detected_keywords': '_keyword_ids'}.get(key, key) for key in FIELDS)
+
+
+class KeywordTable:
+    """検出キーワードとIDの対応（プロセス全体で共有）"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._words: List[str] = []
+        self._lock = threading.Lock()
+
+    def ids(self, words: Iterable[str]) -> Tuple[int, ...]:
+        result = []
+        for word in words:
+            keyword_id = self._ids.get(word)
+            if keyword_id is None:
+                with self._lock:
+                    keyword_id = self._ids.get(word)
+                    if keyword_id is None:
+                        keyword_id = self._ids[word] = len(self._words)
+                        self._words.append(sys.intern(word))
+            result.append(keyword_id)
+        return tuple(result)
+
+    def words(self, ids: Iterable[int]) -> List[str]:
+        return [self._words[keyword_id] for keyword_id in ids]
+
+
+KEYWORDS = KeywordTable()
+
+
+def _to_micros(timestamp: Any) -> Optional[int]:
+    if timestamp is None:
+        return None
+    if isinstance(timestamp, (int, float)):
+        return int(timestamp * 1_000_000)
+    moment = datetime.datetime.fromisoformat(timestamp)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return int(moment.timestamp()) * 1_000_000 + moment.microsecond
+
+
+def _from_micros(micros: int) -> str:
+    seconds, fraction = divmod(micros, 1_000_000)
+    return datetime.datetime.fromtimestamp(seconds).replace(microsecond=fraction).isoformat()
+
+
+class Message(Mapping):
+    """会話履歴の1件（読み取り専用の dict として振る舞う）"""
+
+    __slots__ = ('role', 'content', '_timestamp', 'risk_level', 'needs_type', '_keyword_ids', 'crisis_card',
+                 'model', 'time_to_first_token', 'response_time', '_extra')
+
+    def __init__(self, data: Mapping):
+        # data に無いキーはスロットを未設定のままにする（値が None のキーとは区別する）
+        for key, value in data.items():
+            if key == 'timestamp':
+                self._timestamp = _to_micros(value)
+            elif key == 'detected_keywords':
+                self._keyword_ids = KEYWORDS.ids(value) if value is not None else None
+            elif key in FIELDS:
+                if key in _INTERNED and isinstance(value, str):
+                    value = sys.intern(value)
+                object.__setattr__(self, key, value)
+        extra = {key: value for key, value in data.items() if key not in FIELDS}
+        self._extra = extra or None
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            if key == 'timestamp':
+                return _from_micros(self._timestamp) if self._timestamp is not None else None
+            if key == 'detected_keywords':
+                return KEYWORDS.words(self._keyword_ids) if self._keyword_ids is not None else None
+            if key in FIELDS:
+                return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for key, slot in zip(FIELDS, _SLOTS):
+            if hasattr(self, slot):
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"Message({dict(self)!r})"
+
+
+class MessageView(Sequence):
+    """ストアの一部分（[start, stop)）を指す読み取り専用のリスト
+
+    ストアは追記のみのため、作成時点の件数で区切ったビューは会話の途中の状態のスナップショットになる。
+    """
+
+    def __init__(self, store: 'MessageStore', start: int, stop: int):
+        self._store = store
+        self._start = start
+        self._stop = stop
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return MessageView(self._store, self._start + start, self._start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._store[self._start + index]
+
+    def __iter__(self) -> Iterator[Message]:
+        for index in range(self._start, self._stop):
+            yield self._store[index]
+
+
+class MessageStore(Sequence):
+    """セッションの会話履歴（追記のみ）
+
+    直近 max_in_memory 件をメモリ上に持ち、それより古いものは一時ファイルに JSON lines で退避して
+    インデックス（ファイル内の位置）だけを残す。退避したメッセージも添字で読み出せる。
+    """
+
+    def __init__(self, messages: Iterable[Mapping] = (), max_in_memory: int = MAX_MESSAGES_IN_MEMORY):
+        self.max_in_memory = max_in_memory
+        self._messages: List[Message] = []
+        self._spilled = 0
+        self._spill_file: Optional[IO[bytes]] = None
+        self._spill_offsets = array('q')
+        self._lock = threading.RLock()
+        for message in messages:
+            self.append(message)
+
+    @property
+    def spilled(self) -> int:
+        """一時ファイルへ退避したメッセージ数"""
+        return self._spilled
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._messages)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return self.view()[index]
+        with self._lock:
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError(index)
+            if index >= self._spilled:
+                return self._messages[index - self._spilled]
+            return self._read_spilled(index)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self.view())
+
+    def view(self) -> MessageView:
+        """現時点の全件を指すビュー（バックグラウンドの生成処理に渡すスナップショット）"""
+        return MessageView(self, 0, len(self))
+
+    def append(self, message: Mapping) -> Message:
+        record = message if isinstance(message, Message) else Message(message)
+        with self._lock:
+            self._messages.append(record)
+            if len(self._messages) > self.max_in_memory:
+                self._spill(len(self._messages) - self.max_in_memory + int(self.max_in_memory * SPILL_FRACTION))
+        return record
+
+    def _spill(self, count: int) -> None:
+        if self._spill_file is None:
+            # 閉じると削除される一時ファイル（セッションが破棄されると一緒に消える）
+            self._spill_file = tempfile.TemporaryFile(prefix='chat_history_')
+        spill_file = self._spill_file
+        spill_file.seek(0, os.SEEK_END)
+        for record in self._messages[:count]:
+            self._spill_offsets.append(spill_file.tell())
+            spill_file.write(json.dumps(dict(record), ensure_ascii=False).encode('utf-8') + b'\n')
+        spill_file.flush()
+        del self._messages[:count]
+        self._spilled += count
+
+    def _read_spilled(self, index: int) -> Message:
+        self._spill_file.seek(self._spill_offsets[index])
+        return Message(json.loads(self._spill_file.readline()))
+
+    def memory_usage(self) -> int:
+        """メモリ上のメッセージが使うおおよそのバイト数（本文・レコード・インデックス）"""
+        with self._lock:
+            size = sys.getsizeof(self._messages) + sys.getsizeof(self._spill_offsets)
+            for record in self._messages:
+                size += sys.getsizeof(record) + sys.getsizeof(record.get('content', ''))
+                if getattr(record, '_keyword_ids', None):
+                    size += sys.getsizeof(record._keyword_ids)
+                if record._extra:
+                    size += sys.getsizeof(record._extra)
+            return size
+
+    def close(self) -> None:
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
@@ -0,0 +1,191 @@
+"""処理段階ごとの所要時間（スパン）とモデルごとの試行回数の計測
+
+CHAT_METRICS=1 で有効になる（無効時は span / incr / observe が何もしない）。
+集計は CHAT_METRICS_PATH に書き出す（.jsonl なら1行1スナップショットの JSON lines、
+それ以外は Prometheus のテキスト形式。node_exporter の textfile collector で読める）。
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Iterator, List, Optional, Tuple
+
+ENABLED = os.environ.get('CHAT_METRICS', '') not in ('', '0')
+METRICS_PATH = os.environ.get('CHAT_METRICS_PATH', 'chat_metrics.prom')
+# 応答ごとの書き出し（maybe_export）はこの間隔（秒）に1回までにする
+EXPORT_INTERVAL = float(os.environ.get('CHAT_METRICS_INTERVAL', '10'))
+
+# 所要時間のヒストグラムの区切り（秒）
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NOOP = nullcontext()
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, str]) -> LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], **extra: str) -> str:
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def to_dict(self) -> Dict:
+        return {'count': self.count, 'sum': round(self.total, 6), 'max': round(self.max, 6),
+                'mean': round(self.total / self.count, 6) if self.count else 0.0}
+
+
+class MetricsRegistry:
+    """プロセス全体で共有するスパンとカウンタの集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans: Dict[LabelKey, Histogram] = {}
+        self.counters: Dict[LabelKey, int] = {}
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.spans.get(key)
+            if histogram is None:
+                histogram = self.spans[key] = Histogram()
+            histogram.observe(seconds)
+
+    def incr(self, name: str, amount: int = 1, **labels: str) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'spans': [dict(span=name, **dict(labels), **h.to_dict()) for (name, labels), h in sorted(self.spans.items())],
+                'counters': [dict(name=name, **dict(labels), value=v) for (name, labels), v in sorted(self.counters.items())],
+            }
+
+    def prometheus_text(self) -> str:
+        lines: List[str] = ["# TYPE chat_span_seconds histogram"]
+        with self._lock:
+            for (name, labels), h in sorted(self.spans.items()):
+                labels = (('span', name),) + labels
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.buckets):
+                    cumulative += count
+                    lines.append(f"chat_span_seconds_bucket{_format_labels(labels, le=str(bound))} {cumulative}")
+                lines.append(f"chat_span_seconds_bucket{_format_labels(labels, le='+Inf')} {h.count}")
+                lines.append(f"chat_span_seconds_sum{_format_labels(labels)} {h.total:.6f}")
+                lines.append(f"chat_span_seconds_count{_format_labels(labels)} {h.count}")
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE chat_{name}_total counter")
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f"chat_{name}_total{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def _timed(name: str, labels: Dict[str, str]) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(name, time.perf_counter() - started, **labels)
+
+
+def span(name: str, **labels: str) -> ContextManager:
+    """with 文で囲んだ処理の所要時間を記録する"""
+    if not ENABLED:
+        return _NOOP
+    return _timed(name, labels)
+
+
+def observe(name: str, seconds: float, **labels: str) -> None:
+    """計測済みの所要時間を記録する"""
+    if ENABLED:
+        REGISTRY.observe(name, seconds, **labels)
+
+
+def incr(name: str, **labels: str) -> None:
+    if ENABLED:
+        REGISTRY.incr(name, **labels)
+
+
+# 書き出しは複数セッション（スレッド）から呼ばれるため、1つずつ行う
+_export_lock = threading.Lock()
+_export_state = {'last': float('-inf'), 'running': False}
+
+
+def export(path: Optional[str] = None) -> None:
+    """集計を書き出す（.jsonl は追記、それ以外は Prometheus 形式で置き換え）"""
+    if not ENABLED:
+        return
+    path = path or METRICS_PATH
+    with _export_lock:
+        if path.endswith('.jsonl'):
+            line = json.dumps(dict(timestamp=time.time(), **REGISTRY.snapshot()), ensure_ascii=False)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+            return
+        # 呼び出しごとに別の一時ファイルに書いてから置き換える（読む側が書きかけのファイルを見ない）
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.chat_metrics_')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(REGISTRY.prometheus_text())
+            # mkstemp は所有者のみ読める権限で作るため、collector が読めるようにする
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def _export_in_background() -> None:
+    try:
+        export()
+    finally:
+        with _export_lock:
+            _export_state['running'] = False
+
+
+def maybe_export() -> None:
+    """前回から EXPORT_INTERVAL 秒以上たっていれば、バックグラウンドで書き出す（応答の処理を待たせない）"""
+    if not ENABLED:
+        return
+    now = time.monotonic()
+    with _export_lock:
+        if _export_state['running'] or now - _export_state['last'] < EXPORT_INTERVAL:
+            return
+        _export_state['last'] = now
+        _export_state['running'] = True
+    threading.Thread(target=_export_in_background, name='metrics-export', daemon=True).start()
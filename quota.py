@@ -0,0 +1,218 @@
+"""無料枠のレート制限（RPM / TPM / RPD）をクライアント側で守るためのスケジューラ"""
+import datetime
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# 無料枠の制限値（2025年1月時点）
+MODEL_LIMITS = {
+    'gemini-2.5-flash-lite': {'rpm': 15, 'tpm': 250_000, 'rpd': 1000},
+    'gemini-2.5-flash': {'rpm': 10, 'tpm': 250_000, 'rpd': 250},
+    'gemini-1.5-flash': {'rpm': 15, 'tpm': 250_000, 'rpd': 1500},
+}
+
+# 1日あたりの枠（RPD）は太平洋時間の0時にリセットされる
+try:
+    RPD_RESET_TIMEZONE: datetime.tzinfo = ZoneInfo('America/Los_Angeles')
+except ZoneInfoNotFoundError:
+    # タイムゾーンのデータがない環境（tzdata 未導入の Windows など）では太平洋標準時で近似する
+    RPD_RESET_TIMEZONE = datetime.timezone(datetime.timedelta(hours=-8))
+
+# 待機してもリクエストを送れない場合に諦めるまでの秒数
+DEFAULT_MAX_WAIT = 5.0
+
+# 残量の割合がこれ以上あるモデルは、候補の並び順（優先度）どおりに選ぶ
+PREFERRED_HEADROOM = 0.2
+
+
+class QuotaExceededError(Exception):
+    """待機時間内にどのモデルの枠も空かなかった"""
+
+
+def estimate_tokens(text: str) -> int:
+    """送信前にプロンプトのトークン数を概算する
+
+    日本語は1文字あたりおよそ1トークン、英数字は4文字でおよそ1トークンとして
+    多めに見積もる。
+    """
+    ascii_chars = sum(1 for ch in text if ch < '\x80')
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+class TokenBucket:
+    """一定の速度で補充されるトークンバケット"""
+
+    def __init__(self, capacity: float, period: float):
+        self.capacity = float(capacity)
+        self.rate = capacity / period  # 1秒あたりの補充量
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self.tokens
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """amount を取得できるまでの秒数（容量を超える量は取得できないため inf）"""
+        if amount > self.capacity:
+            return float('inf')
+        self._refill(now)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= amount
+
+
+class DailyWindow:
+    """毎日決まった時刻（太平洋時間の0時）にリセットされる固定窓の枠
+
+    TokenBucket と同じ形で使えるが、使った分は日中に補充されず、リセット時に全量が戻る。
+    now（monotonic）は使わず、clock（実時間）で日付の区切りを判定する。
+    """
+
+    def __init__(self, capacity: float, clock: Callable[[], float] = time.time,
+                 timezone: datetime.tzinfo = RPD_RESET_TIMEZONE):
+        self.capacity = float(capacity)
+        self.clock = clock
+        self.timezone = timezone
+        self.used = 0.0
+        self.resets_at = self._next_reset(clock())
+
+    def _next_reset(self, timestamp: float) -> float:
+        today = datetime.datetime.fromtimestamp(timestamp, self.timezone).date()
+        tomorrow = datetime.datetime.combine(today + datetime.timedelta(days=1), datetime.time(), self.timezone)
+        return tomorrow.timestamp()
+
+    def _roll(self) -> float:
+        current = self.clock()
+        if current >= self.resets_at:
+            self.used = 0.0
+            self.resets_at = self._next_reset(current)
+        return current
+
+    def available(self, now: float) -> float:
+        self._roll()
+        return self.capacity - self.used
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """amount を取得できるまでの秒数（今日の残りで足りなければ次のリセットまで）"""
+        if amount > self.capacity:
+            return float('inf')
+        current = self._roll()
+        if self.capacity - self.used >= amount:
+            return 0.0
+        return self.resets_at - current
+
+    def consume(self, amount: float, now: float) -> None:
+        self._roll()
+        self.used += amount
+
+    def exhaust(self) -> None:
+        """次のリセットまで使い切ったものとして扱う"""
+        self._roll()
+        self.used = max(self.used, self.capacity)
+
+
+class QuotaScheduler:
+    """モデルごと・制限ごとのトークンバケットでリクエストを振り分ける
+
+    プロセス内の全セッションで1つのインスタンスを共有する前提でスレッドセーフに作られている。
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, int]]] = None, max_wait: float = DEFAULT_MAX_WAIT,
+                 clock: Callable[[], float] = time.time):
+        self.limits = limits or MODEL_LIMITS
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Dict[str, Union[TokenBucket, DailyWindow]]] = {
+            model_name: {
+                'rpm': TokenBucket(limit['rpm'], 60),
+                'tpm': TokenBucket(limit['tpm'], 60),
+                'rpd': DailyWindow(limit['rpd'], clock),
+            }
+            for model_name, limit in self.limits.items()
+        }
+
+    def _cost(self, tokens: int) -> Dict[str, int]:
+        return {'rpm': 1, 'tpm': tokens, 'rpd': 1}
+
+    def _headroom(self, model_name: str, tokens: int, now: float) -> float:
+        """リクエスト後に残る割合の最小値（送れない場合は負）"""
+        cost = self._cost(tokens)
+        return min(
+            (bucket.available(now) - cost[dimension]) / bucket.capacity
+            for dimension, bucket in self._buckets[model_name].items()
+        )
+
+    def _wait_time(self, model_name: str, tokens: int, now: float) -> float:
+        cost = self._cost(tokens)
+        return max(
+            bucket.wait_time(cost[dimension], now)
+            for dimension, bucket in self._buckets[model_name].items()
+        )
+
+    def acquire(self, model_names: Sequence[str], tokens: int, max_wait: Optional[float] = None) -> Optional[str]:
+        """余裕のあるモデルの枠を確保してモデル名を返す
+
+        残量が十分なモデルがあれば候補の並び順で最初のものを、なければ最も余裕のあるものを選ぶ。
+        どのモデルにも空きがなければ空くまで最大 max_wait 秒待ち、それでも空かなければNone。
+        制限値が登録されていないモデルは常に送信可能として扱う。
+        """
+        if max_wait is None:
+            max_wait = self.max_wait
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                best_name = None
+                best_headroom = -1.0
+                soonest = float('inf')
+                for model_name in model_names:
+                    if model_name not in self._buckets:
+                        return model_name
+                    headroom = self._headroom(model_name, tokens, now)
+                    if best_headroom < PREFERRED_HEADROOM and headroom >= 0 and headroom > best_headroom:
+                        best_name, best_headroom = model_name, headroom
+                    soonest = min(soonest, self._wait_time(model_name, tokens, now))
+
+                if best_name is not None:
+                    for dimension, amount in self._cost(tokens).items():
+                        self._buckets[best_name][dimension].consume(amount, now)
+                    return best_name
+
+            if now + soonest > deadline:
+                return None
+            time.sleep(min(soonest, deadline - now) + 0.01)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """モデル・制限ごとの残量（表示用）"""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                model_name: {dimension: bucket.available(now) for dimension, bucket in buckets.items()}
+                for model_name, buckets in self._buckets.items()
+            }
+
+    def mark_exhausted(self, model_name: str, daily: bool = False) -> None:
+        """APIから429が返ったモデルの分間枠を使い切ったものとして扱う
+
+        daily=True（1日あたりの上限による429）の場合は、次のリセットまで1日の枠も使い切ったものとする。
+        """
+        with self._lock:
+            buckets = self._buckets.get(model_name)
+            if buckets:
+                now = time.monotonic()
+                for dimension in ('rpm', 'tpm'):
+                    buckets[dimension].consume(buckets[dimension].available(now), now)
+                if daily:
+                    buckets['rpd'].exhaust()
@@ -0,0 +1,149 @@
+"""会話の最初の一言（「相談したい」「話を聞いて」、あいさつ等）への応答のキャッシュ
+
+CHAT_RESPONSE_CACHE=1 で有効になる。キーは（正規化した発言, リスクレベル, ニーズ, 会話の最初かどうか）で、
+会話の最初の短い発言だけを対象にする。リスクレベル3以上では決して使わない（毎回モデルに応答させる）。
+1つのキーにつき VARIANTS 件の応答が集まるまではモデルに応答させて蓄え、その後はそこから無作為に選ぶ。
+エントリは最終利用順（LRU）で最大 MAX_ENTRIES 件、作成から TTL_SECONDS 秒で破棄する。
+"""
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import metrics
+
+ENABLED = os.environ.get('CHAT_RESPONSE_CACHE', '') not in ('', '0')
+TTL_SECONDS = float(os.environ.get('CHAT_RESPONSE_CACHE_TTL', str(6 * 60 * 60)))
+MAX_ENTRIES = int(os.environ.get('CHAT_RESPONSE_CACHE_SIZE', '256'))
+VARIANTS = int(os.environ.get('CHAT_RESPONSE_CACHE_VARIANTS', '3'))
+
+# これより高いリスクレベルの発言には使わない（リスクレベル3以上は対象外）
+MAX_CACHEABLE_RISK_LEVEL = 2
+# 定型の書き出しとみなす長さの上限（正規化後の文字数）。長い相談は内容が人それぞれのため対象外
+MAX_MESSAGE_CHARS = 30
+# キャッシュから返した応答の model 欄（分析でモデルの応答時間と混ざらないようにする）
+CACHE_MODEL_NAME = 'response-cache'
+
+CacheKey = Tuple[str, int, str, bool]
+
+_IGNORED = re.compile(r'[\W_ー〜~]+')
+
+
+def normalize_message(text: str) -> str:
+    """全角・半角、大文字・小文字、記号・空白・長音の違いを無視した比較用の文字列"""
+    return _IGNORED.sub('', unicodedata.normalize('NFKC', text).casefold())
+
+
+def is_opening(user_message: str, chat_history: Sequence[Dict]) -> bool:
+    """会話の最初の発言か（履歴が空か、履歴が現在の発言だけ）"""
+    if not chat_history:
+        return True
+    return len(chat_history) == 1 and chat_history[-1]['role'] == 'user' and chat_history[-1]['content'] == user_message
+
+
+class CachedResponse:
+    """キャッシュした応答を ResponseStream と同じ形で返す"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.model_name = CACHE_MODEL_NAME
+        self.time_to_first_token = 0.0
+        self.total_time = 0.0
+        self.last_error: Optional[Exception] = None
+
+    def __iter__(self) -> Iterator[str]:
+        yield self.text
+
+
+class _Entry:
+    __slots__ = ('created', 'variants')
+
+    def __init__(self, created: float):
+        self.created = created
+        self.variants: List[str] = []
+
+
+class ResponseCache:
+    """最初の一言への応答のキャッシュ（プロセス全体で共有）"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SECONDS, variants: int = VARIANTS,
+                 rng: Optional[random.Random] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = variants
+        self._rng = rng or random.Random()
+        self._entries: 'OrderedDict[CacheKey, _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def key_for(self, user_message: str, risk_level: int, needs_type: str,
+                chat_history: Sequence[Dict]) -> Optional[CacheKey]:
+        """キャッシュの対象ならキーを、対象外（リスクレベル3以上・会話の途中・長い発言）なら None を返す"""
+        normalized = normalize_message(user_message)
+        opening = is_opening(user_message, chat_history)
+        if risk_level > MAX_CACHEABLE_RISK_LEVEL or not opening or not normalized or len(normalized) > MAX_MESSAGE_CHARS:
+            with self._lock:
+                self.skipped += 1
+            metrics.incr('response_cache', result='skip')
+            return None
+        return (normalized, risk_level, needs_type, opening)
+
+    def lookup(self, key: CacheKey) -> Optional[str]:
+        """応答が VARIANTS 件そろっていればそのうち1つを返す（そろうまでは None を返し、モデルに応答させる）"""
+        if key[1] > MAX_CACHEABLE_RISK_LEVEL:
+            return None
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None or len(entry.variants) < self.variants:
+                self.misses += 1
+                text = None
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                text = self._rng.choice(entry.variants)
+        metrics.incr('response_cache', result='miss' if text is None else 'hit')
+        return text
+
+    def store(self, key: CacheKey, text: str) -> None:
+        """モデルが正常に返した応答を蓄える"""
+        if key[1] > MAX_CACHEABLE_RISK_LEVEL or not text:
+            return
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(time.monotonic())
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            if len(entry.variants) < self.variants and text not in entry.variants:
+                entry.variants.append(text)
+            self._entries.move_to_end(key)
+
+    def _live_entry(self, key: CacheKey) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.created > self.ttl:
+            del self._entries[key]
+            return None
+        return entry
+
+    def stats(self) -> Dict[str, float]:
+        """ヒット率と、キャッシュから返したことで節約できたAPI呼び出し回数（＝1日の利用枠の消費）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'lookups': lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'requests_saved': self.hits,
+                'skipped': self.skipped,
+            }
+
+
+# アプリ全体で共有するキャッシュ（無効時は None）
+RESPONSE_CACHE: Optional[ResponseCache] = ResponseCache() if ENABLED else None
@@ -0,0 +1,147 @@
+"""会話全体のリスク状態（複数ターンにまたがる兆候の蓄積と減衰）"""
+import datetime
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional
+
+from analysis import RISK_KEYWORDS, analyze_texts
+
+# 1ターンごと・経過時間ごとに蓄積値を減衰させる
+TURN_DECAY = 0.9
+HALF_LIFE_SECONDS = 30 * 60
+
+# 蓄積値（レベル3以上の兆候の重みの合計）がこの値以上なら、そのレベルとみなす
+# 例: 「疲れた」「眠れない」「不安」とレベル3の発言が続くと、3件目で 4 → 7.6 → 10.84 となりレベル4になる
+#     （2件では 7.6 でレベル3のまま）。レベル4の発言が4件続くと 7 → 13.3 → 18.97 → 24.07 でレベル5になる
+LOAD_THRESHOLDS = {5: 24.0, 4: 10.0, 3: 4.0}
+TRACKED_LEVELS = (3, 4, 5)
+
+# 直前のターンからの蓄積値の変化がこの幅を超えたら、上昇・低下とみなす
+TREND_MARGIN = 1.0
+
+
+def _parse_timestamp(timestamp) -> Optional[float]:
+    if timestamp is None or isinstance(timestamp, (int, float)):
+        return timestamp
+    try:
+        return datetime.datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class RiskTracker:
+    """セッションごとのリスク状態
+
+    各ターンでは新しい発言の判定結果だけを加算し（履歴は読み直さない）、
+    それまでの蓄積はターン数と経過時間に応じて減衰させる。
+    """
+
+    def __init__(self):
+        self.turns = 0
+        self.level = 0
+        self.peak_level = 0
+        self.scores: Dict[int, float] = {level: 0.0 for level in TRACKED_LEVELS}  # 減衰込みのレベル別蓄積
+        self.level_counts: Dict[int, int] = {level: 0 for level in TRACKED_LEVELS}  # レベル別の検出件数（累計）
+        self.keyword_counts: Dict[str, int] = {}
+        self.last_timestamp: Optional[float] = None
+        self._recent_loads: Deque[float] = deque(maxlen=2)
+
+    @property
+    def load(self) -> float:
+        return sum(self.scores.values())
+
+    @property
+    def trend(self) -> str:
+        """直前のターンからの変化で見た傾向（'rising' / 'falling' / 'stable'）"""
+        if len(self._recent_loads) < 2:
+            return 'stable'
+        change = self._recent_loads[-1] - self._recent_loads[-2]
+        if change > TREND_MARGIN:
+            return 'rising'
+        if change < -TREND_MARGIN:
+            return 'falling'
+        return 'stable'
+
+    def cumulative_level(self) -> int:
+        """蓄積値から見たリスクレベル（該当なしは0）"""
+        load = self.load
+        for level in sorted(LOAD_THRESHOLDS, reverse=True):
+            if load >= LOAD_THRESHOLDS[level]:
+                return level
+        return 0
+
+    def update(self, risk_level: int, risk_scores: Dict[int, int], detected_keywords: Iterable[str] = (),
+               timestamp=None) -> int:
+        """1件の発言の判定結果を反映し、現在のリスクレベルを返す"""
+        timestamp = _parse_timestamp(timestamp)
+        decay = TURN_DECAY
+        if timestamp is not None and self.last_timestamp is not None and timestamp > self.last_timestamp:
+            decay *= 0.5 ** ((timestamp - self.last_timestamp) / HALF_LIFE_SECONDS)
+        if timestamp is not None:
+            self.last_timestamp = timestamp
+
+        for level in TRACKED_LEVELS:
+            self.scores[level] *= decay
+            score = risk_scores.get(level, 0)
+            if score:
+                self.scores[level] += score
+                self.level_counts[level] += score // RISK_KEYWORDS[level]['weight']
+        # キーワード以外（言い回しの類似度）で判定されたレベルも同じ重みで加える
+        if risk_level in self.scores and not risk_scores.get(risk_level):
+            self.scores[risk_level] += RISK_KEYWORDS[risk_level]['weight']
+            self.level_counts[risk_level] += 1
+        for keyword in detected_keywords:
+            self.keyword_counts[keyword] = self.keyword_counts.get(keyword, 0) + 1
+
+        self.turns += 1
+        self.level = max(risk_level, self.cumulative_level())
+        self.peak_level = max(self.peak_level, self.level)
+        self._recent_loads.append(self.load)
+        return self.level
+
+    def update_from(self, analysis, timestamp=None) -> int:
+        """analyze_text の結果から反映する"""
+        return self.update(analysis.risk_level, analysis.risk_scores, analysis.detected_keywords, timestamp)
+
+    def snapshot(self) -> Dict:
+        return {
+            'level': self.level,
+            'peak_level': self.peak_level,
+            'trend': self.trend,
+            'load': round(self.load, 2),
+            'turns': self.turns,
+        }
+
+    def to_dict(self) -> Dict:
+        """中断・再開用に状態を保存する"""
+        return {
+            'turns': self.turns,
+            'level': self.level,
+            'peak_level': self.peak_level,
+            'scores': {str(level): score for level, score in self.scores.items()},
+            'level_counts': {str(level): count for level, count in self.level_counts.items()},
+            'keyword_counts': self.keyword_counts,
+            'last_timestamp': self.last_timestamp,
+            'recent_loads': list(self._recent_loads),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RiskTracker':
+        tracker = cls()
+        tracker.turns = data['turns']
+        tracker.level = data['level']
+        tracker.peak_level = data['peak_level']
+        tracker.scores = {int(level): score for level, score in data['scores'].items()}
+        tracker.level_counts = {int(level): count for level, count in data['level_counts'].items()}
+        tracker.keyword_counts = dict(data['keyword_counts'])
+        tracker.last_timestamp = data['last_timestamp']
+        tracker._recent_loads.extend(data['recent_loads'])
+        return tracker
+
+    @classmethod
+    def replay(cls, chat_history: List[Dict]) -> 'RiskTracker':
+        """保存済みの会話履歴（相談者の発言）をまとめて判定し、順に反映した状態を作る"""
+        tracker = cls()
+        user_messages = [msg for msg in chat_history if msg['role'] == 'user']
+        for msg, analysis in zip(user_messages, analyze_texts(msg['content'] for msg in user_messages)):
+            tracker.update_from(analysis, msg.get('timestamp'))
+        return tracker
@@ -0,0 +1,125 @@
+"""キーワードに一致しない言い回しを拾うための、文字n-gramによる意味的なリスク判定
+
+ネットワークを使わず、メッセージと各リスクレベルの典型的な言い回し（プロトタイプ）を
+ハッシュ化した文字n-gramのベクトルで比較する。
+"""
+import unicodedata
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# リスクレベルごとの典型的な言い回し（ひらがな・言い換えを含む）
+RISK_PROTOTYPES = {
+    5: ['死にたい', 'しにたい', '死にたくなる', '死んでしまいたい', '死ねたらいいのに', '自殺したい',
+        '自殺を考えている', '消えてしまいたい', 'きえたい', 'いなくなりたい', '生きていたくない',
+        '生きている意味がない', 'この世からいなくなりたい', '命を絶ちたい', '全部終わりにしたい',
+        '飛び降りたい', '手首を切った', 'リスカした', '薬をたくさん飲んだ', '首を吊りたい', '遺書を書いた'],
+    4: ['もう限界', 'げんかい', '誰も助けてくれない', '誰にも頼れない', '居場所がない', 'ひとりぼっち',
+        '学校に行けない', '学校に行きたくない', '絶望している', 'もう無理', '耐えられない', 'たえられない',
+        '助けてほしい', 'たすけて', '誰も信じられない', '自分には価値がない', '自分なんていらない'],
+    3: ['つらい', 'しんどい', '苦しい', 'くるしい', '眠れない', 'ねむれない', '食欲がない', '疲れた',
+        'つかれた', '不安でたまらない', 'ストレスがたまっている', 'プレッシャーがきつい', '泣いてばかり',
+        'やる気が出ない', '気分が落ち込む'],
+}
+
+# プロトタイプのn-gramのうち、メッセージに含まれる割合がこの値以上なら該当とみなす
+# （benchmarks/bench_semantic.py --sweep で、近い言い回しの安全な文を含むラベル付きデータから決めた値。
+#   レベル5は「きえたと思った」が「きえたい」の5つのn-gramのうち3つに一致する程度の部分一致では該当させない）
+RISK_THRESHOLDS = {5: 0.8, 4: 0.7, 3: 0.75}
+
+NGRAM_SIZES = (2, 3)
+DIMENSIONS = 1 << 14
+BATCH_ROWS = 256
+
+# カタカナ→ひらがな（表記ゆれを吸収する）
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize('NFKC', text).lower().translate(_KATAKANA_TO_HIRAGANA)
+
+
+class SemanticScorer:
+    """プロトタイプ行列との類似度でリスクレベルを判定する
+
+    各プロトタイプは n-gram の出現を 1/n-gram数 で重み付けした行ベクトルで、
+    メッセージの n-gram（二値）との内積は「プロトタイプの n-gram のうちメッセージに現れた割合」になる。
+    余弦類似度と違い長いメッセージでも値が薄まらないため、長文の中の一言も拾える。
+    """
+
+    def __init__(self, prototypes: Dict[int, List[str]] = RISK_PROTOTYPES,
+                 thresholds: Dict[int, float] = RISK_THRESHOLDS, dimensions: int = DIMENSIONS):
+        self.dimensions = dimensions
+        self._index_cache: Dict[str, int] = {}
+        levels = []
+        rows = []
+        for level in sorted(prototypes, reverse=True):
+            for phrase in prototypes[level]:
+                indices = self.indices(phrase)
+                if len(indices):
+                    rows.append(indices)
+                    levels.append(level)
+        # n-gram ごとの行（n-gram 数×プロトタイプ数）。メッセージに含まれる n-gram の行を足すと類似度になる
+        self.weights = np.zeros((dimensions, len(rows)), dtype=np.float32)
+        for row, indices in enumerate(rows):
+            self.weights[indices, row] = 1.0 / len(indices)
+        self.row_levels = np.array(levels, dtype=np.int64)
+        self.row_thresholds = np.array([thresholds[level] for level in levels], dtype=np.float32)
+
+    def indices(self, text: str) -> np.ndarray:
+        """テキストに含まれる n-gram のハッシュ値（重複なし）"""
+        text = normalize(text)
+        cache = self._index_cache
+        found = set()
+        for n in NGRAM_SIZES:
+            for start in range(len(text) - n + 1):
+                gram = text[start:start + n]
+                index = cache.get(gram)
+                if index is None:
+                    # プロセスごとに値が変わる hash() ではなく crc32 を使う
+                    index = zlib.crc32(gram.encode('utf-8')) % self.dimensions
+                    if len(cache) < 100_000:
+                        cache[gram] = index
+                found.add(index)
+        return np.fromiter(found, dtype=np.int64, count=len(found))
+
+    def similarities(self, text: str) -> np.ndarray:
+        """各プロトタイプとの類似度"""
+        indices = self.indices(text)
+        if not len(indices):
+            return np.zeros(len(self.row_levels), dtype=np.float32)
+        return self.weights[indices].sum(axis=0)
+
+    def _levels(self, similarities: np.ndarray, thresholds: Optional[np.ndarray] = None) -> np.ndarray:
+        """類似度（メッセージ数×プロトタイプ数）から該当する最高レベルを求める（該当なしは0）"""
+        hits = similarities >= (self.row_thresholds if thresholds is None else thresholds)
+        return np.where(hits, self.row_levels, 0).max(axis=-1, initial=0)
+
+    def score(self, text: str) -> int:
+        """メッセージ1件のリスクレベル（該当なしは0）"""
+        return int(self._levels(self.similarities(text)))
+
+    def levels_with(self, similarities: np.ndarray, thresholds: Dict[int, float]) -> np.ndarray:
+        """別のしきい値で判定し直す（しきい値の調整用。similarities は similarities_batch の結果）"""
+        row_thresholds = np.array([thresholds[level] for level in self.row_levels.tolist()], dtype=np.float32)
+        return self._levels(similarities, row_thresholds)
+
+    def similarities_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """複数メッセージの各プロトタイプとの類似度（メッセージ数×プロトタイプ数）"""
+        result = np.zeros((len(texts), len(self.row_levels)), dtype=np.float32)
+        for offset in range(0, len(texts), BATCH_ROWS):
+            # 短いメッセージの n-gram はごく一部なので、密な行列積ではなく該当する行だけを集めて足す
+            chunk = [self.indices(text) for text in texts[offset:offset + BATCH_ROWS]]
+            lengths = np.array([len(indices) for indices in chunk], dtype=np.int64)
+            found = lengths > 0
+            if found.any():
+                starts = (np.cumsum(lengths) - lengths)[found]
+                sums = np.add.reduceat(self.weights[np.concatenate(chunk)], starts, axis=0)
+                result[offset:offset + len(chunk)][found] = sums
+        return result
+
+    def score_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """複数メッセージのリスクレベルを行列積でまとめて求める"""
+        return self._levels(self.similarities_batch(texts)).astype(np.int64)
+
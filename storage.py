@@ -0,0 +1,197 @@
+"""会話履歴・フィードバックの永続化（SQLite WAL への非同期バッチ書き込み）"""
+import abc
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 保存先（環境変数で変更できる。CHAT_STORAGE=none で保存しない）
+DEFAULT_DB_PATH = os.environ.get('CHAT_DB_PATH', 'chat_data.sqlite3')
+DEFAULT_BACKEND = os.environ.get('CHAT_STORAGE', 'sqlite')
+
+# メッセージ本体として列に持つキー（それ以外は meta にJSONで保存）
+_MESSAGE_COLUMNS = ('role', 'content', 'timestamp')
+
+
+class StorageBackend(abc.ABC):
+    """保存先の共通インターフェース"""
+
+    @abc.abstractmethod
+    def write_batch(self, messages: List[Tuple], feedback: List[Tuple]) -> None:
+        """messages: (session_id, seq, message) / feedback: (session_id, feedback) のリストをまとめて書き込む"""
+
+    @abc.abstractmethod
+    def load_session(self, session_id: str) -> Tuple[List[Dict], List[Dict]]:
+        """セッションの (会話履歴, フィードバック) を読み込む"""
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteBackend(StorageBackend):
+    """WALモードのSQLite（書き込みは1スレッドから、読み込みは並行して行える）"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT,
+                meta TEXT,
+                PRIMARY KEY (session_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS feedback (
+                session_id TEXT NOT NULL,
+                message_id INTEGER NOT NULL,
+                rating INTEGER NOT NULL,
+                timestamp TEXT
+            );
+            CREATE INDEX IF NOT EXISTS feedback_session ON feedback (session_id);
+        """)
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def write_batch(self, messages: List[Tuple], feedback: List[Tuple]) -> None:
+        if self._conn is None:
+            self._conn = self._connect()
+        message_rows = []
+        for session_id, seq, message in messages:
+            meta = {k: v for k, v in message.items() if k not in _MESSAGE_COLUMNS}
+            message_rows.append((session_id, seq, message['role'], message['content'], message.get('timestamp'),
+                                 json.dumps(meta, ensure_ascii=False) if meta else None))
+        feedback_rows = [(session_id, fb['message_id'], fb['rating'], fb.get('timestamp')) for session_id, fb in feedback]
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?)", message_rows)
+            self._conn.executemany("INSERT INTO feedback VALUES (?, ?, ?, ?)", feedback_rows)
+
+    def load_session(self, session_id: str) -> Tuple[List[Dict], List[Dict]]:
+        conn = self._connect()
+        try:
+            messages = []
+            for role, content, timestamp, meta in conn.execute(
+                    "SELECT role, content, timestamp, meta FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)):
+                message = {'role': role, 'content': content, 'timestamp': timestamp}
+                if meta:
+                    message.update(json.loads(meta))
+                messages.append(message)
+            feedback = [
+                {'message_id': message_id, 'rating': rating, 'timestamp': timestamp}
+                for message_id, rating, timestamp in conn.execute(
+                    "SELECT message_id, rating, timestamp FROM feedback WHERE session_id = ? ORDER BY rowid", (session_id,))
+            ]
+            return messages, feedback
+        finally:
+            conn.close()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+STORAGE_BACKENDS = {
+    'sqlite': SQLiteBackend,
+}
+
+
+class AsyncWriter:
+    """書き込みをキューに積み、専用スレッドでまとめて保存する
+
+    enqueue はブロックしないため、応答のたびの保存で待ち時間が増えない。
+    キューが上限に達した場合は書き込みを破棄して件数を記録する。
+    """
+
+    def __init__(self, backend: StorageBackend, max_queue: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.5):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='storage-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _put(self, item: Tuple) -> None:
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("storage queue is full; dropped %d writes so far", self.dropped)
+
+    def save_message(self, session_id: str, seq: int, message: Dict[str, Any]) -> None:
+        self._put(('message', (session_id, seq, dict(message))))
+
+    def save_feedback(self, session_id: str, feedback: Dict[str, Any]) -> None:
+        self._put(('feedback', (session_id, dict(feedback))))
+
+    def load_session(self, session_id: str) -> Tuple[List[Dict], List[Dict]]:
+        return self.backend.load_session(session_id)
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            try:
+                items = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            messages, feedback = [], []
+            for kind, payload in items:
+                if kind == 'stop':
+                    stop = True
+                elif kind == 'message':
+                    messages.append(payload)
+                else:
+                    feedback.append(payload)
+            if messages or feedback:
+                try:
+                    self.backend.write_batch(messages, feedback)
+                except Exception:
+                    logger.exception("failed to write %d records", len(messages) + len(feedback))
+            for _ in items:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """キューに積まれた書き込みが保存されるまで待つ"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """残りの書き込みを保存して終了する（プロセス終了時にも呼ばれる）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(('stop', None))
+        self._thread.join()
+        self.backend.close()
+
+
+def open_storage(backend: str = DEFAULT_BACKEND, **options: Any) -> Optional[AsyncWriter]:
+    """設定に応じた保存先を開く（'none' の場合はNone）"""
+    if backend == 'none':
+        return None
+    return AsyncWriter(STORAGE_BACKENDS[backend](**options))
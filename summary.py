@@ -0,0 +1,87 @@
+"""会話のまとめを差分だけで更新するためのキャッシュとプロンプト"""
+import hashlib
+from typing import Dict, List, Optional
+
+SUMMARY_INSTRUCTIONS = """
+【まとめる内容】
+1. 相談の主なテーマ（2-3行）
+2. 相談者の気持ちや状況（2-3行）
+3. 話し合った内容のポイント（3-5項目、箇条書き）
+4. 今後に向けてのヒント（2-3行）
+
+温かく、前向きなトーンでまとめてください。専門用語は避け、相談者が自分の状況を客観的に振り返れるようにしてください。
+"""
+
+
+def format_conversation(messages: List[Dict]) -> str:
+    """会話履歴をプロンプト用のテキストに整形"""
+    return "".join(
+        f"相談者: {msg['content']}\n" if msg['role'] == 'user' else f"AI: {msg['content']}\n"
+        for msg in messages
+    )
+
+
+def extend_digest(digest: str, messages: List[Dict]) -> str:
+    """これまでの履歴のハッシュに新しいメッセージを連結したハッシュ（履歴全体を読み直さない）"""
+    for msg in messages:
+        digest = hashlib.sha256(f"{digest}\x00{msg['role']}\x00{msg['content']}".encode('utf-8')).hexdigest()
+    return digest
+
+
+def build_summary_prompt(chat_history: List[Dict]) -> str:
+    """会話全体からまとめを作るプロンプト"""
+    return f"""
+以下は学生相談システムでの会話履歴です。この会話を振り返り、以下の観点でまとめてください:
+
+【会話履歴】
+{format_conversation(chat_history)}
+{SUMMARY_INSTRUCTIONS}"""
+
+
+def build_incremental_summary_prompt(previous_summary: str, new_messages: List[Dict]) -> str:
+    """前回のまとめと、その後の会話だけからまとめ直すプロンプト"""
+    return f"""
+以下は学生相談システムでの会話について、これまでのまとめと、その後に続いた会話です。これまでのまとめに新しい会話の内容を反映し、以下の観点でまとめ直してください:
+
+【これまでのまとめ】
+{previous_summary}
+
+【その後の会話】
+{format_conversation(new_messages)}
+{SUMMARY_INSTRUCTIONS}"""
+
+
+class SummaryCache:
+    """セッションごとに、最後のまとめと要約済みの履歴件数を保持する"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self.summary: Optional[str] = None
+        self.covered = 0      # 要約済みのメッセージ数
+        self.digest = ""      # 要約済みの履歴のハッシュ
+        self._results: Dict[str, str] = {}
+
+    def lookup(self, chat_history: List[Dict]) -> Optional[str]:
+        """新しいメッセージがなければ前回のまとめを返す"""
+        if len(chat_history) < self.covered:
+            # 履歴が巻き戻っている（リセット等）場合は作り直す
+            self.clear()
+            return None
+        digest = extend_digest(self.digest, chat_history[self.covered:])
+        return self._results.get(digest)
+
+    def build_prompt(self, chat_history: List[Dict]) -> str:
+        """前回のまとめがあれば差分だけを送るプロンプトを、なければ全体のプロンプトを返す"""
+        if self.summary is None or self.covered == 0:
+            return build_summary_prompt(chat_history)
+        return build_incremental_summary_prompt(self.summary, chat_history[self.covered:])
+
+    def store(self, chat_history: List[Dict], summary: str) -> None:
+        """生成に成功したまとめを記録する"""
+        self.digest = extend_digest(self.digest, chat_history[self.covered:])
+        self.covered = len(chat_history)
+        self.summary = summary
+        # 直前の結果だけを残す（同じ履歴での再クリックに即答するため）
+        self._results = {self.digest: summary}
@@ -0,0 +1,29 @@
+import os
+import sys
+
+# モジュールはリポジトリ直下に置かれているため、どこから pytest を実行しても読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+import fake_gemini  # noqa: E402
+from fake_gemini import FakeModelProfile  # noqa: E402
+from gemini_client import MODELS_TO_TRY  # noqa: E402
+
+# 待ち時間なしで応答する既定のモデル設定
+FAST_PROFILE = dict(latency=0.001, latency_sigma=0.0, chunk_interval=0.0, chunks=4)
+
+
+@pytest.fixture
+def profiles():
+    """テストごとに擬似モデルの設定を差し替え、終わったら元に戻す
+
+    profiles(**{モデル名: {設定}}) の設定は FAST_PROFILE に上書きして使い、指定しないモデルは FAST_PROFILE のまま。
+    """
+    saved = dict(fake_gemini._profiles)
+
+    def use(**by_model: dict) -> None:
+        fake_gemini.configure(profiles={name: FakeModelProfile(**{**FAST_PROFILE, **by_model.get(name, {})})
+                                        for name in MODELS_TO_TRY})
+    yield use
+    fake_gemini.configure(profiles=saved)
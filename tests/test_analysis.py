@@ -0,0 +1,95 @@
+"""キーワード照合器（1回の走査）が従来の二重ループと同じ判定を返すことの確認"""
+import random
+from typing import List, Tuple
+
+import pytest
+
+import analysis
+from analysis import NEEDS_KEYWORDS, RISK_KEYWORDS
+from keyword_matcher import KeywordMatcher
+
+
+def legacy_analyze_risk_level(text: str) -> Tuple[int, List[str]]:
+    """変更前の判定（キーワードごとに部分文字列を探す）"""
+    detected_keywords = []
+    risk_scores = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+    text_lower = text.lower()
+    for level, data in RISK_KEYWORDS.items():
+        for keyword in data['keywords']:
+            if keyword in text_lower:
+                risk_scores[level] += data['weight']
+                detected_keywords.append(keyword)
+    max_level = 1
+    max_score = 0
+    for level, score in risk_scores.items():
+        if score > max_score:
+            max_score = score
+            max_level = level
+    return max_level, detected_keywords
+
+
+def legacy_analyze_needs(text: str) -> str:
+    text_lower = text.lower()
+    needs_scores = {'listening': 0, 'solution': 0, 'thinking': 0}
+    for need_type, keywords in NEEDS_KEYWORDS.items():
+        for keyword in keywords:
+            if keyword in text_lower:
+                needs_scores[need_type] += 1
+    if max(needs_scores.values()) == 0:
+        return 'listening'
+    return max(needs_scores, key=needs_scores.get)
+
+
+def random_texts(count: int, seed: int = 20240601) -> List[str]:
+    """キーワード・その一部・無関係な文字を混ぜた相談文（重なり合う一致や大文字も含む）"""
+    rng = random.Random(seed)
+    keywords = [keyword for data in RISK_KEYWORDS.values() for keyword in data['keywords']]
+    keywords += [keyword for words in NEEDS_KEYWORDS.values() for keyword in words]
+    fillers = ["、", "。", "けど", "最近", "ABC", "です", "本当に", " ", "ストレスフル", "聞いてほしいです"]
+    texts = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(0, 8)):
+            keyword = rng.choice(keywords)
+            roll = rng.random()
+            if roll < 0.5:
+                parts.append(keyword)
+            elif roll < 0.7:
+                parts.append(keyword[:rng.randint(1, len(keyword))])
+            else:
+                parts.append(rng.choice(fillers))
+        texts.append("".join(parts))
+    return texts
+
+
+@pytest.mark.parametrize("text", ["", "死にたい", "辛い辛い辛い", "友達と部活と勉強と進路", "どうすれば解決できる？一緒に考えたい",
+                                  "消えたい", "アドバイスがほしい。ADVICE"])
+def test_matches_legacy_examples(text):
+    result = analysis._analyze(text, 0)
+    assert (result.keyword_level, result.detected_keywords) == legacy_analyze_risk_level(text)
+    assert result.needs_type == legacy_analyze_needs(text)
+
+
+def test_matches_legacy_on_random_texts():
+    for text in random_texts(5000):
+        result = analysis._analyze(text, 0)
+        assert (result.keyword_level, result.detected_keywords) == legacy_analyze_risk_level(text), text
+        assert result.needs_type == legacy_analyze_needs(text), text
+
+
+def test_semantic_level_only_raises_the_level():
+    result = analysis._analyze("友達", 4)
+    assert result.keyword_level == 2
+    assert result.risk_level == 4
+    assert analysis._analyze("死にたい", 3).risk_level == 5
+
+
+def test_find_and_automaton_return_the_same_matches():
+    """キーワード数で切り替わる2通りの照合（str.find / オートマトン）が同じ順序で同じ一致を返す"""
+    keywords = [keyword for data in RISK_KEYWORDS.values() for keyword in data['keywords']]
+    keywords += [keyword for values in NEEDS_KEYWORDS.values() for keyword in values]
+    keywords += ['い', 'いい', 'いいい', 'ない', 'しない']  # 重なり・包含を含む
+    by_find = KeywordMatcher(keywords, use_automaton=False)
+    by_automaton = KeywordMatcher(keywords, use_automaton=True)
+    for text in random_texts(2000) + ['いいいいい', 'しないしない']:
+        assert list(by_find.iter_matches(text)) == list(by_automaton.iter_matches(text)), text
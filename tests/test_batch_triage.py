@@ -0,0 +1,73 @@
+"""batch_triage（保存済みの相談内容の再判定）をコマンドラインから実行して確認する"""
+import json
+
+import pytest
+
+import batch_triage
+from analysis import analyze_text
+
+RECORDS = [
+    {'session_id': 's1', 'role': 'user', 'content': '最近眠れなくて辛い', 'id': 1},
+    {'session_id': 's1', 'role': 'assistant', 'content': 'それは辛いですね', 'id': 2},
+    {'session_id': 's1', 'role': 'user', 'content': '死にたいと思うことがある', 'id': 3},
+    {'session_id': 's2', 'role': 'user', 'content': '部活の人間関係で悩んでいます', 'id': 4},
+    {'session_id': 's2', 'role': 'user', 'content': 'どうすれば解決できるか一緒に考えてほしい', 'id': 5},
+    {'session_id': 's3', 'role': 'user', 'content': '消えたい', 'id': 6},
+    {'session_id': 's3', 'role': 'user', 'content': '', 'id': 7},
+    {'session_id': 's4', 'role': 'user', 'content': '友達と進路の話をした', 'id': 8},
+]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / 'archive.jsonl'
+    path.write_text(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in RECORDS), encoding='utf-8')
+    return path
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def triage(archive, out, *options):
+    batch_triage.main([str(archive), '--out', str(out), '--processes', '1', *options])
+    return read_jsonl(f'{out}.messages.jsonl'), read_jsonl(f'{out}.conversations.jsonl')
+
+
+def test_scores_user_messages_like_analyze_text(archive, tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_triage, 'CHUNK_SIZE', 3)  # 複数のチャンクに分かれる
+    messages, conversations = triage(archive, tmp_path / 'out' / 'rescore')
+    users = [record for record in RECORDS if record['role'] == 'user']
+    assert [m['id'] for m in messages] == [record['id'] for record in users]
+    for message, record in zip(messages, users):
+        expected = analyze_text(record['content'])
+        assert message['risk_level'] == expected.risk_level
+        assert message['detected_keywords'] == expected.detected_keywords
+        assert message['needs_type'] == expected.needs_type
+    assert [c['conversation_id'] for c in conversations] == ['s1', 's2', 's3', 's4']
+    assert conversations[0]['messages'] == 2
+    assert conversations[0]['max_risk_level'] == analyze_text('死にたいと思うことがある').risk_level
+
+
+def test_resume_after_interruption_matches_a_full_run(archive, tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_triage, 'WINDOW_SIZE', 2)
+    expected = triage(archive, tmp_path / 'full', '--checkpoint-every', '2')
+
+    read_records = batch_triage.read_records
+
+    def interrupted(*args, **kwargs):
+        for count, record in enumerate(read_records(*args, **kwargs)):
+            if count == 7:
+                raise KeyboardInterrupt
+            yield record
+
+    monkeypatch.setattr(batch_triage, 'read_records', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        triage(archive, tmp_path / 'partial', '--checkpoint-every', '4')
+    # チェックポイントより後に書き出した分（5・6件目）は再開時に切り詰められる
+    checkpoint = json.loads((tmp_path / 'partial.checkpoint.json').read_text(encoding='utf-8'))
+    assert checkpoint['records'] == 4
+
+    monkeypatch.setattr(batch_triage, 'read_records', read_records)
+    assert triage(archive, tmp_path / 'partial', '--checkpoint-every', '4', '--resume') == expected
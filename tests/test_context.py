@@ -0,0 +1,32 @@
+"""会話履歴（直近の発言＋古い発言の要点）が予算内に収まることの確認"""
+from typing import Dict, List
+
+from context import ContextBuilder, format_turn
+from quota import estimate_tokens
+
+
+def conversation(turns: int) -> List[Dict]:
+    history = []
+    for i in range(turns):
+        history.append({'role': 'user', 'content': f"最近学校に行くのがしんどくて夜も眠れない（{i}回目）。" * 3})
+        history.append({'role': 'assistant', 'content': "それはつらいですね。少しずつ話してください。" * 3,
+                        'detected_keywords': ['しんどい']})
+    return history
+
+
+def test_history_with_memory_stays_within_budget():
+    builder = ContextBuilder()
+    history = conversation(200)
+    for end in range(1, len(history) + 1):
+        text = builder.build_history(history[:end], 1000)
+        assert estimate_tokens(text) <= 1000, end
+        # 直近の発言は要点に畳み込まず、そのまま残す
+        assert text.endswith(format_turn(history[end - 1]))
+    assert builder.memory_text() and text.startswith(builder.memory_text())
+
+
+def test_short_history_is_not_folded():
+    builder = ContextBuilder()
+    history = conversation(2)
+    assert builder.build_history(history, 1000) == "".join(format_turn(msg) for msg in history)
+    assert builder.folded == 0
@@ -0,0 +1,144 @@
+"""エラーの分類と、サーキットブレーカー・ヘッジ送信を代役モデルで確認する"""
+import gc
+import threading
+import time
+
+import pytest
+
+from fake_gemini import FakeQuotaError, FakeServiceError, fake_model_factory
+from fallback import (FATAL, QUOTA, TRANSIENT, CircuitBreaker, FallbackEngine, LatencyTracker, classify_error,
+                      retry_after_hint)
+from gemini_client import MODELS_TO_TRY
+
+FIRST, SECOND = MODELS_TO_TRY[0], MODELS_TO_TRY[1]
+
+
+class ResourceExhausted(Exception):
+    """google.api_core.exceptions.ResourceExhausted と同じ名前の例外"""
+
+
+@pytest.mark.parametrize("error, expected", [
+    (FakeQuotaError("429 Resource has been exhausted (e.g. check quota)."), QUOTA),
+    (ResourceExhausted("Resource has been exhausted"), QUOTA),
+    (Exception("429 Resource has been exhausted (e.g. check quota)."), QUOTA),
+    (FakeServiceError("503 The model is overloaded"), TRANSIENT),
+    (Exception("503 The model is overloaded"), TRANSIENT),
+    (TimeoutError(), TRANSIENT),
+    (ConnectionError("reset"), TRANSIENT),
+    # 数値や単語が文中に含まれるだけのエラーは再試行しない
+    (ValueError("max_output_tokens 500 exceeds the limit"), FATAL),
+    (ValueError("invalid argument: 429 is not a valid temperature"), FATAL),
+    (ValueError("quota project is not set"), FATAL),
+    (Exception("400 API key not valid"), FATAL),
+])
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
+
+
+def generate(factory):
+    def attempt(model_name: str) -> str:
+        return factory(model_name).generate_content("相談者: こんにちは\n\nAI:").text
+    return attempt
+
+
+def test_breaker_opens_on_quota_error_with_retry_hint(profiles):
+    # 1分あたり1回までのモデル: 2回目は "retry in 60s" 付きの429になる
+    profiles(**{FIRST: dict(rpm=1)})
+    engine = FallbackEngine(hedge=False, backoff_base=0.0)
+    attempt = generate(fake_model_factory("test-breaker", seed=1))
+
+    assert engine.run(MODELS_TO_TRY, 10, attempt)[0] == FIRST
+    model_name, _ = engine.run(MODELS_TO_TRY, 10, attempt)
+    assert model_name == SECOND
+
+    breaker = engine.breaker(FIRST)
+    assert isinstance(breaker.last_error, FakeQuotaError)
+    assert retry_after_hint(breaker.last_error) == 60
+    assert not breaker.allow()
+    assert breaker.open_until - time.monotonic() == pytest.approx(60, abs=1)
+    # 遮断中は送信せずに次のモデルを使う
+    assert engine.run(MODELS_TO_TRY, 10, attempt)[0] == SECOND
+
+
+def test_hedge_wins_when_first_model_is_slow(profiles):
+    profiles(**{FIRST: dict(latency=1.0)})
+    engine = FallbackEngine(hedge=True, latency=LatencyTracker(default_delay=0.05, min_delay=0.05))
+    started = time.perf_counter()
+    model_name, text = engine.run(MODELS_TO_TRY, 10, generate(fake_model_factory("test-hedge", seed=1)))
+    elapsed = time.perf_counter() - started
+    assert model_name == SECOND
+    assert text
+    assert elapsed < 0.9
+
+
+def test_breaker_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05)
+    breaker.record_failure(FakeServiceError("503 The model is overloaded"))
+    assert not breaker.allow()
+    time.sleep(0.06)
+    # クールダウン後は1件だけ通し、その結果が出るまで他は通さない
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure(FakeServiceError("503 The model is overloaded"))
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+
+class SlowResult:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def test_hedge_loser_is_closed_and_recorded():
+    slow_result = SlowResult()
+    release = threading.Event()
+
+    def attempt(model_name):
+        if model_name == FIRST:
+            release.wait(5)
+            return slow_result
+        return 'fast'
+
+    engine = FallbackEngine(hedge=True, latency=LatencyTracker(default_delay=0.05, min_delay=0.05))
+    assert engine.run([FIRST, SECOND], 10, attempt, discard=lambda result: result.close()) == (SECOND, 'fast')
+    release.set()
+    # 採用されなかった試行も、終わった時点で結果を手放す
+    assert slow_result.closed.wait(5)
+
+
+def test_hedge_loser_failure_reaches_breaker():
+    failed = threading.Event()
+    release = threading.Event()
+
+    def attempt(model_name):
+        if model_name == FIRST:
+            release.wait(5)
+            failed.set()
+            raise FakeServiceError("503 The model is overloaded")
+        return 'fast'
+
+    engine = FallbackEngine(hedge=True, failure_threshold=1,
+                            latency=LatencyTracker(default_delay=0.05, min_delay=0.05))
+    assert engine.run([FIRST, SECOND], 10, attempt)[0] == SECOND
+    release.set()
+    failed.wait(5)
+    deadline = time.monotonic() + 5
+    while engine.breaker(FIRST).allow() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert isinstance(engine.breaker(FIRST).last_error, FakeServiceError)
+    assert not engine.breaker(FIRST).allow()
+
+
+def test_engine_shuts_down_its_workers_when_released():
+    engine = FallbackEngine()
+    executor = engine._executor
+    assert engine.run([FIRST], 10, lambda model_name: 'ok') == (FIRST, 'ok')
+    del engine
+    gc.collect()
+    assert executor._shutdown
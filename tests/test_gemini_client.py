@@ -0,0 +1,94 @@
+"""ResponseStream（ストリーミング応答とフォールバック）とAPIキーごとのクライアントを代役で確認する"""
+import pytest
+
+from fake_gemini import FakeServiceError, fake_model_factory
+from fallback import FallbackEngine
+from gemini_client import MODELS_TO_TRY, ModelRegistry, ResponseStream, use_client
+
+FIRST, SECOND = MODELS_TO_TRY[0], MODELS_TO_TRY[1]
+
+
+def make_stream(api_key: str) -> ResponseStream:
+    return ResponseStream("相談者: 眠れない\n\nAI:", fake_model_factory(api_key, seed=1),
+                          engine=FallbackEngine(hedge=False, backoff_base=0.0))
+
+
+def test_streams_all_chunks(profiles):
+    profiles()
+    stream = make_stream("test-stream")
+    chunks = list(stream)
+    assert len(chunks) == 4
+    assert stream.text == "".join(chunks)
+    assert stream.model_name == FIRST
+    assert stream.last_error is None
+    assert stream.time_to_first_token is not None and stream.total_time >= stream.time_to_first_token
+
+
+def test_falls_back_before_first_chunk(profiles):
+    profiles(**{FIRST: dict(quota_error_rate=1.0)})
+    stream = make_stream("test-fallback")
+    text = "".join(stream)
+    assert stream.model_name == SECOND
+    assert stream.last_error is None
+    assert text and "利用制限" not in text
+
+
+def test_failure_mid_stream_keeps_partial_text(profiles):
+    profiles(**{FIRST: dict(stream_failure_rate=1.0)})
+    stream = make_stream("test-midstream")
+    text = "".join(stream)
+    # 途中まで表示した応答は別モデルでやり直さず、途切れた旨を付けて終える
+    assert stream.model_name == FIRST
+    assert isinstance(stream.last_error, FakeServiceError)
+    assert text.endswith("（通信が途切れたため、応答が途中で終了しました）")
+    assert len(text) > len("\n\n（通信が途切れたため、応答が途中で終了しました）")
+
+
+def test_all_models_failing_returns_error_message(profiles):
+    profiles(**{name: dict(quota_error_rate=1.0) for name in MODELS_TO_TRY})
+    stream = make_stream("test-all-fail")
+    text = "".join(stream)
+    assert stream.model_name is None
+    assert "利用制限" in text
+
+
+class RecordingClient:
+    """APIキーごとのクライアントの代役（受け取ったリクエストを記録する）"""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.requests = []
+
+    def _response(self, text: str):
+        from google.ai import generativelanguage as glm
+        return glm.GenerateContentResponse(candidates=[glm.Candidate(
+            content=glm.Content(role="model", parts=[glm.Part(text=text)]), finish_reason=1)])
+
+    def generate_content(self, request, **kwargs):
+        self.requests.append(request)
+        return self._response(self.api_key)
+
+    def stream_generate_content(self, request, **kwargs):
+        self.requests.append(request)
+        return iter([self._response("途中"), self._response(self.api_key)])
+
+
+def test_registry_sends_through_the_client_for_each_key():
+    """インストールされている SDK が、差し替えたAPIキーごとのクライアントで送信することの確認"""
+    pytest.importorskip("google.generativeai")
+    registry = ModelRegistry()
+    clients = {}
+    registry._client = lambda api_key: clients.setdefault(api_key, RecordingClient(api_key))
+    first, second = registry.get("key-a", FIRST), registry.get("key-b", FIRST)
+    assert first.generate_content("こんにちは").text == "key-a"
+    assert second.generate_content("こんにちは").text == "key-b"
+    assert "".join(chunk.text for chunk in first.generate_content("こんにちは", stream=True)) == "途中key-a"
+    assert len(clients["key-a"].requests) == 2 and len(clients["key-b"].requests) == 1
+
+
+def test_use_client_refuses_models_without_a_client_attribute():
+    class Model:
+        pass
+
+    with pytest.raises(RuntimeError):
+        use_client(Model(), RecordingClient("key-a"))
@@ -0,0 +1,56 @@
+"""計測値の書き出しが複数スレッドから同時に呼ばれても壊れないことの確認"""
+import threading
+import time
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(metrics, 'ENABLED', True)
+    metrics.REGISTRY.clear()
+    yield
+    metrics.REGISTRY.clear()
+
+
+def test_concurrent_exports(enabled, tmp_path):
+    path = str(tmp_path / 'chat_metrics.prom')
+    metrics.incr('model_attempts', model='m')
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(100):
+                metrics.export(path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with open(path, encoding='utf-8') as f:
+        assert 'chat_model_attempts_total{model="m"} 1' in f.read()
+    # 一時ファイルが残っていない
+    assert [p.name for p in tmp_path.iterdir()] == ['chat_metrics.prom']
+
+
+def test_maybe_export_is_throttled(enabled, tmp_path, monkeypatch):
+    path = tmp_path / 'chat_metrics.prom'
+    monkeypatch.setattr(metrics, 'METRICS_PATH', str(path))
+    monkeypatch.setattr(metrics, 'EXPORT_INTERVAL', 60.0)
+    monkeypatch.setattr(metrics, '_export_state', {'last': float('-inf'), 'running': False})
+    calls = []
+    original = metrics.export
+    monkeypatch.setattr(metrics, 'export', lambda: calls.append(1) or original())
+    for _ in range(20):
+        metrics.maybe_export()
+    deadline = time.monotonic() + 5
+    while metrics._export_state['running'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert calls == [1]
+    assert path.exists()
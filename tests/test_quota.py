@@ -0,0 +1,87 @@
+"""1日あたりの枠（RPD）が太平洋時間の0時にリセットされる固定窓として扱われることの確認"""
+import datetime
+
+import pytest
+
+from fallback import FallbackEngine, is_daily_quota_error
+from quota import RPD_RESET_TIMEZONE, DailyWindow, QuotaScheduler
+
+LIMITS = {'model-a': {'rpm': 1000, 'tpm': 1_000_000, 'rpd': 3}}
+
+
+class Clock:
+    def __init__(self, *moment: int):
+        self.now = datetime.datetime(*moment, tzinfo=RPD_RESET_TIMEZONE).timestamp()
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class DailyQuotaError(Exception):
+    code = 429
+
+    def __str__(self) -> str:
+        return ('429 Quota exceeded for metric: generativelanguage.googleapis.com/generate_content_free_tier_requests '
+                '[violations {\n  quota_metric: "generativelanguage.googleapis.com/generate_content_free_tier_requests"\n'
+                '  quota_id: "GenerateRequestsPerDayPerProjectPerModel-FreeTier"\n}]')
+
+
+class MinuteQuotaError(Exception):
+    code = 429
+
+    def __str__(self) -> str:
+        return '429 Quota exceeded [violations {\n  quota_id: "GenerateRequestsPerMinutePerProjectPerModel-FreeTier"\n}]'
+
+
+def test_daily_window_does_not_refill_during_the_day():
+    clock = Clock(2025, 1, 10, 1, 0)
+    window = DailyWindow(3, clock)
+    window.consume(3, 0)
+    clock.advance(20 * 60 * 60)  # 同じ日の21時
+    assert window.available(0) == 0
+    assert window.wait_time(1, 0) == pytest.approx(3 * 60 * 60)
+
+
+def test_daily_window_resets_at_pacific_midnight():
+    clock = Clock(2025, 1, 10, 23, 59)
+    window = DailyWindow(3, clock)
+    window.consume(3, 0)
+    clock.advance(61)
+    assert window.available(0) == 3
+
+
+def test_daily_window_follows_daylight_saving_time():
+    # 夏時間の開始日（2025-03-09）は23時間で次の0時になる
+    clock = Clock(2025, 3, 9, 0, 0)
+    window = DailyWindow(1, clock)
+    window.consume(1, 0)
+    assert window.wait_time(1, 0) == pytest.approx(23 * 60 * 60)
+
+
+def test_scheduler_admits_at_most_the_daily_limit_per_calendar_day():
+    clock = Clock(2025, 1, 10, 0, 30)
+    scheduler = QuotaScheduler(LIMITS, clock=clock)
+    admitted = 0
+    for _ in range(24 * 6):
+        if scheduler.acquire(['model-a'], 10, max_wait=0) is not None:
+            admitted += 1
+        clock.advance(10 * 60)
+    # 1日目に3回、翌日0時のリセット後に3回
+    assert admitted == 6
+
+
+def test_daily_quota_error_drains_the_daily_window():
+    clock = Clock(2025, 1, 10, 9, 0)
+    scheduler = QuotaScheduler(LIMITS, clock=clock)
+    assert is_daily_quota_error(DailyQuotaError())
+    assert not is_daily_quota_error(MinuteQuotaError())
+
+    engine = FallbackEngine(scheduler=scheduler)
+    engine._record_failure('model-a', MinuteQuotaError())
+    assert scheduler.snapshot()['model-a']['rpd'] == 3
+    engine._record_failure('model-a', DailyQuotaError())
+    assert scheduler.snapshot()['model-a']['rpd'] == 0
+    assert scheduler.acquire(['model-a'], 10, max_wait=0) is None
@@ -0,0 +1,55 @@
+"""会話全体のリスク状態（蓄積による段階の引き上げと傾向）の確認"""
+import analysis
+from risk_tracker import RiskTracker
+
+
+def feed(texts):
+    tracker = RiskTracker()
+    levels = [tracker.update_from(analysis.analyze_text(text)) for text in texts]
+    return tracker, levels
+
+
+def test_moderate_signals_escalate():
+    _, levels = feed(['部活で疲れた', '夜も眠れない', '明日のテストが不安'])
+    assert levels == [3, 3, 4]
+
+
+def test_two_moderate_signals_do_not_escalate():
+    _, levels = feed(['部活で疲れた', '夜も眠れない'])
+    assert levels == [3, 3]
+
+
+def test_repeated_high_risk_escalates_to_five():
+    _, levels = feed(['もう限界'] * 4)
+    assert levels == [4, 4, 4, 5]
+
+
+def test_signals_spread_over_time_do_not_escalate():
+    tracker = RiskTracker()
+    for hour, text in enumerate(['部活で疲れた', '夜も眠れない', '明日のテストが不安']):
+        level = tracker.update_from(analysis.analyze_text(text), timestamp=hour * 60 * 60)
+    assert level == 3
+
+
+def test_trend_uses_latest_change():
+    tracker = RiskTracker()
+    tracker._recent_loads.extend([0.0, 10.0, 13.0, 11.7])
+    assert tracker.trend == 'falling'
+    tracker._recent_loads.append(11.2)
+    assert tracker.trend == 'stable'
+    tracker._recent_loads.append(15.0)
+    assert tracker.trend == 'rising'
+
+
+def test_trend_falls_once_signals_stop():
+    tracker, _ = feed(['部活で疲れた', '夜も眠れない', '明日のテストが不安'])
+    assert tracker.trend == 'rising'
+    tracker.update_from(analysis.analyze_text('ありがとう、少し楽になった'))
+    assert tracker.trend == 'falling'
+
+
+def test_state_round_trip():
+    tracker, _ = feed(['部活で疲れた', '夜も眠れない'])
+    restored = RiskTracker.from_dict(tracker.to_dict())
+    assert restored.snapshot() == tracker.snapshot()
+    assert restored.update_from(analysis.analyze_text('明日のテストが不安')) == 4
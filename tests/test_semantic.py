@@ -0,0 +1,65 @@
+"""意味的なリスク判定の、部分一致による段階の引き上げと、ラベル付きデータでの精度の確認"""
+import json
+import os
+
+import pytest
+
+import analysis
+from semantic import SemanticScorer
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'benchmarks', 'fixtures', 'risk_labels.jsonl')
+
+
+@pytest.fixture(scope='module')
+def scorer():
+    return SemanticScorer()
+
+
+@pytest.mark.parametrize('text', ['きえたと思ったデータが見つかった', 'テストが終わった！全部終わりにできてうれしい'])
+def test_partial_match_is_not_level_five(scorer, text):
+    assert scorer.score(text) < 5
+    assert analysis.analyze_text(text).risk_level < 5
+
+
+def test_semantic_only_hit_is_capped():
+    result = analysis.analyze_text('しにたい')
+    assert result.semantic_level == 5
+    assert result.risk_level == analysis.SEMANTIC_ONLY_MAX_LEVEL
+
+
+def test_semantic_hit_with_keyword_is_not_capped():
+    result = analysis.analyze_text('しにたい。夜も眠れない')
+    assert result.keyword_level == 3
+    assert result.risk_level == 5
+
+
+def test_batch_matches_single(scorer):
+    texts = ['たすけてくれてありがとう', 'たすけて', '消えたくなる夜がある', 'もう無理ゲー', 'しにたい']
+    assert scorer.score_batch(texts).tolist() == [scorer.score(text) for text in texts]
+    assert [r.risk_level for r in analysis.analyze_texts(texts)] == [analysis.analyze_text(t).risk_level for t in texts]
+
+
+def test_analyze_needs_skips_semantic_scorer(monkeypatch):
+    def fail():
+        raise AssertionError("analyze_needs では2段目の判定を使わない")
+    monkeypatch.setattr(analysis, 'get_semantic_scorer', fail)
+    assert analysis.analyze_needs('どうすればいいか教えて') == 'solution'
+
+
+def test_fixture_precision_and_recall():
+    """ラベル付きデータ（近い言い回しの安全な文を含む）で、適合率・検出率が下がっていないこと"""
+    with open(FIXTURE_PATH, encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    predicted = [result.risk_level for result in analysis.analyze_texts([row['text'] for row in rows])]
+    labels = [row['risk_level'] for row in rows]
+
+    def precision_recall(cutoff):
+        true_positives = sum(p >= cutoff and l >= cutoff for p, l in zip(predicted, labels))
+        return true_positives / sum(p >= cutoff for p in predicted), true_positives / sum(l >= cutoff for l in labels)
+
+    # レベル5（119番の案内）は誤検出なし
+    assert precision_recall(5)[0] == 1.0
+    precision, recall = precision_recall(4)
+    assert precision >= 0.69
+    assert recall >= 0.87